@@ -0,0 +1,86 @@
+"""
+Compares catch attempts serialized per channel, as with max_concurrency, checking the
+guess with GET and claiming with DEL, against the atomic claim script with no lock, in
+attempts per second with many concurrent guessers in a few channels. Needs a local redis
+and writes to database 15. Run from the repository root with
+`python -m benchmarks.catch_claim`.
+"""
+
+import asyncio
+import random
+import time
+from collections import defaultdict
+
+import aioredis
+
+from helpers import wild
+
+NUM_CHANNELS = 10
+NUM_GUESSERS = 200
+NUM_ATTEMPTS = 20
+WRONG_RATE = 0.8
+
+
+class Species:
+    def __init__(self, id):
+        self.id = id
+        self.correct_guesses = [f"species{id}"]
+
+
+async def spawn(redis, channel_id):
+    species = Species(random.randint(1, 809))
+    await wild.spawn(redis, channel_id, species.id, species.correct_guesses)
+
+
+async def locked_attempt(redis, locks, channel_id, guess):
+    async with locks[channel_id]:
+        state = await wild.fetch(redis, channel_id)
+        if state is None:
+            return
+        if guess != f"species{state.species_id}":
+            return
+        await redis.delete(f"wild:{channel_id}")
+    await spawn(redis, channel_id)
+
+
+async def script_attempt(redis, locks, channel_id, guess):
+    result = await wild.claim(redis, channel_id, guess, 0)
+    if result is not None and result[0] == wild.CAUGHT:
+        await spawn(redis, channel_id)
+
+
+async def guesser(redis, attempt, locks):
+    for i in range(NUM_ATTEMPTS):
+        channel_id = random.randint(1, NUM_CHANNELS)
+        if random.random() < WRONG_RATE:
+            guess = "wrong"
+        else:
+            state = await wild.fetch(redis, channel_id)
+            guess = f"species{state.species_id if state else 0}"
+        await attempt(redis, locks, channel_id, guess)
+
+
+async def measure(redis, attempt):
+    for i in range(1, NUM_CHANNELS + 1):
+        await spawn(redis, i)
+
+    locks = defaultdict(asyncio.Lock)
+    start = time.perf_counter()
+    await asyncio.gather(*(guesser(redis, attempt, locks) for i in range(NUM_GUESSERS)))
+    return NUM_GUESSERS * NUM_ATTEMPTS / (time.perf_counter() - start)
+
+
+async def main():
+    redis = await aioredis.create_redis_pool("redis://localhost", db=15, maxsize=50)
+
+    for name, attempt in (("GET + DEL, locked", locked_attempt), ("claim script", script_attempt)):
+        rate = await measure(redis, attempt)
+        print(f"{name:<20} {rate:10,.0f} attempts/s")
+
+    await redis.flushdb()
+    redis.close()
+    await redis.wait_closed()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
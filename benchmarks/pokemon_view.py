@@ -0,0 +1,80 @@
+"""
+Compares building pokémon from mongo documents with umongo against the read-only
+PokemonView, in construction time and memory allocated per 10,000 documents.
+Run from the repository root with `python -m benchmarks.pokemon_view`.
+"""
+
+import random
+import time
+import tracemalloc
+from datetime import datetime
+
+from bson.objectid import ObjectId
+from motor.motor_asyncio import AsyncIOMotorClient
+from umongo import Instance
+
+from cogs import mongo
+
+NUM_DOCUMENTS = 10000
+NUM_ROUNDS = 5
+
+
+def make_document(idx):
+    ivs = [mongo.random_iv() for i in range(6)]
+    return {
+        "_id": ObjectId(),
+        "timestamp": datetime.utcnow(),
+        "owner_id": 398686833153933313,
+        "idx": idx,
+        "species_id": random.randint(1, 809),
+        "level": random.randint(1, 100),
+        "xp": 0,
+        "nature": mongo.random_nature(),
+        "shiny": random.randint(1, 4096) == 1,
+        "iv_hp": ivs[0],
+        "iv_atk": ivs[1],
+        "iv_defn": ivs[2],
+        "iv_satk": ivs[3],
+        "iv_sdef": ivs[4],
+        "iv_spd": ivs[5],
+        "iv_total": sum(ivs),
+        "moves": [],
+    }
+
+
+def measure(build, documents):
+    timings = []
+    for i in range(NUM_ROUNDS):
+        start = time.perf_counter()
+        result = [build(x) for x in documents]
+        timings.append(time.perf_counter() - start)
+        del result
+
+    tracemalloc.start()
+    result = [build(x) for x in documents]
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return min(timings), allocated
+
+
+def main():
+    instance = Instance(AsyncIOMotorClient()["benchmark"])
+    instance.register(mongo.PokemonBase)
+    Pokemon = instance.register(mongo.Pokemon)
+
+    documents = [make_document(i) for i in range(1, NUM_DOCUMENTS + 1)]
+
+    for name, build in (
+        ("umongo Pokemon", Pokemon.build_from_mongo),
+        ("PokemonView", mongo.PokemonView.build_from_mongo),
+    ):
+        seconds, allocated = measure(build, documents)
+        print(
+            f"{name:<16} {seconds * 1000:8.1f} ms  {allocated / 1024 / 1024:8.2f} MiB"
+            f"  per {NUM_DOCUMENTS:,} documents"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+"""
+Drives the Spawning cog with synthetic traffic from a number of guilds with a number of
+users each, at a fixed total rate of messages per second, a share of which are catch
+attempts. Reports messages handled per second, mongo and redis operations per message,
+handler latency and spawn queue depth. The cogs run unchanged against a local mongod and
+redis-server, using the poketwo_load database and redis database 15, which are cleared.
+Run from the repository root with `python -m benchmarks.spawn_load`, see --help.
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from types import SimpleNamespace
+
+import discord
+from bson.objectid import ObjectId
+from discord.ext import commands
+
+from bot import ClusterBot, determine_prefix
+from cogs import bot as bot_cog
+from helpers import wild
+from helpers.cache import LRUCache
+
+CONFIG = SimpleNamespace(
+    DATABASE_URI="mongodb://localhost",
+    DATABASE_NAME="poketwo_load",
+    REDIS_CONF={"address": "redis://localhost", "db": 15},
+)
+
+ALL_PERMISSIONS = discord.Permissions.all()
+
+
+class FakeUser:
+    def __init__(self, id, bot=False):
+        self.id = id
+        self.bot = bot
+        self.mention = f"<@{id}>"
+        self.display_name = f"User {id}"
+
+    def __str__(self):
+        return self.display_name
+
+
+class FakeChannel:
+    def __init__(self, id, guild):
+        self.id = id
+        self.guild = guild
+        self.mention = f"<#{id}>"
+        self.sent = 0
+
+    def permissions_for(self, member):
+        return ALL_PERMISSIONS
+
+    async def send(self, content=None, *, embed=None, file=None, **kwargs):
+        self.sent += 1
+        embeds = [] if embed is None else [embed]
+        return SimpleNamespace(id=random.getrandbits(63), embeds=embeds, channel=self)
+
+
+class FakeGuild:
+    def __init__(self, id, me):
+        self.id = id
+        self.me = me
+        self.channel = FakeChannel(id, self)
+
+    def get_channel(self, id):
+        return self.channel if id == self.channel.id else None
+
+
+class FakeMessage:
+    def __init__(self, id, author, guild, content):
+        self.id = id
+        self.author = author
+        self.guild = guild
+        self.channel = guild.channel
+        self.content = content
+
+
+class FakeContext:
+    def __init__(self, message):
+        self.message = message
+        self.author = message.author
+        self.guild = message.guild
+        self.channel = message.channel
+
+    async def send(self, *args, **kwargs):
+        return await self.channel.send(*args, **kwargs)
+
+
+class Prefixes(commands.Cog, name="Bot"):
+    """Stands in for the Bot cog, which needs a gateway connection for its tasks."""
+
+    def __init__(self, bot):
+        self.bot = bot
+
+    determine_prefix = bot_cog.Bot.determine_prefix
+
+
+class LoadBot(commands.Bot):
+    Embed = ClusterBot.Embed
+    mongo = ClusterBot.mongo
+    redis = ClusterBot.redis
+    data = ClusterBot.data
+    log = ClusterBot.log
+    parse_command = ClusterBot.parse_command
+    get_command_context = ClusterBot.get_command_context
+
+    def __init__(self):
+        self.cluster_name = "Load"
+        self.cluster_idx = 0
+        self.config = CONFIG
+        self.enabled = True
+        self.guilds_by_channel = {}
+        self.parsed_messages = LRUCache(maxsize=1000, ttl=60)
+
+        super().__init__(command_prefix=determine_prefix)
+
+        for i in ("logging", "data", "redis", "mongo", "spawning"):
+            self.load_extension(f"cogs.{i}")
+        self.add_cog(Prefixes(self))
+
+        self._connection.user = FakeUser(1, bot=True)
+        self.log.setLevel("WARNING")
+
+    def get_channel(self, id):
+        guild = self.guilds_by_channel.get(id)
+        return guild and guild.channel
+
+
+async def setup(bot, args):
+    await bot.get_cog("Redis").wait_until_ready()
+    await bot.redis.flushdb()
+    await bot.mongo.db.client.drop_database(CONFIG.DATABASE_NAME)
+
+    guilds, users = [], []
+    for g in range(args.guilds):
+        guild = FakeGuild(1000000 + g, bot.user)
+        bot.guilds_by_channel[guild.channel.id] = guild
+        guilds.append(guild)
+        users.append([FakeUser(1000000000 + g * args.users + u) for u in range(args.users)])
+
+    members, pokemon = [], []
+    for user in (x for y in users for x in y):
+        pokemon_id = ObjectId()
+        pokemon.append(
+            {
+                "_id": pokemon_id,
+                "owner_id": user.id,
+                "idx": 1,
+                "species_id": random.randint(1, 809),
+                "level": 1,
+                "xp": 0,
+                "nature": "Hardy",
+                "shiny": False,
+                "iv_hp": 0,
+                "iv_atk": 0,
+                "iv_defn": 0,
+                "iv_satk": 0,
+                "iv_sdef": 0,
+                "iv_spd": 0,
+                "iv_total": 0,
+                "moves": [],
+            }
+        )
+        members.append({"_id": user.id, "selected_id": pokemon_id, "next_idx": 2})
+
+    await bot.mongo.db.member.insert_many(members)
+    await bot.mongo.db.pokemon.insert_many(pokemon)
+
+    bot._ready.set()
+    return guilds, users
+
+
+async def counters(bot):
+    status = await bot.mongo.db.command("serverStatus")
+    info = await bot.redis.info("stats")
+    return sum(status["opcounters"].values()), int(info["stats"]["total_commands_processed"])
+
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1000
+
+
+async def run(args):
+    bot = LoadBot()
+    guilds, users = await setup(bot, args)
+    spawning = bot.get_cog("Spawning")
+
+    latencies = []
+    depths = []
+    handled = 0
+    errors = 0
+
+    async def handle(message, catch):
+        nonlocal handled, errors
+        start = time.perf_counter()
+        try:
+            if catch:
+                guess = "wrong"
+                state = await wild.fetch(bot.redis, message.channel.id)
+                if state is not None and random.random() < 0.5:
+                    guess = bot.data.species_by_number(state.species_id).correct_guesses[0]
+                await spawning.catch.callback(spawning, FakeContext(message), guess=guess)
+            else:
+                await spawning.on_message(message)
+        except Exception:
+            if errors == 0:
+                bot.log.exception("Handler failed")
+            errors += 1
+            return
+        latencies.append(time.perf_counter() - start)
+        handled += 1
+
+    async def sample_depth():
+        while True:
+            depths.append(await bot.redis.llen(spawning.queue_key))
+            await asyncio.sleep(1)
+
+    sampler = asyncio.create_task(sample_depth())
+    mongo_before, redis_before = await counters(bot)
+
+    tasks = []
+    interval = 1 / args.rate
+    start = time.perf_counter()
+
+    for i in range(int(args.rate * args.duration)):
+        g = random.randrange(len(guilds))
+        catch = random.random() < args.catch_rate
+        author = random.choice(users[g])
+        content = "p!catch" if catch else "hello there"
+        message = FakeMessage(i + 1, author, guilds[g], content)
+        tasks.append(asyncio.create_task(handle(message, catch)))
+
+        delay = start + (i + 1) * interval - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+    sampler.cancel()
+
+    await spawning.xp.flush()
+    mongo_after, redis_after = await counters(bot)
+
+    print(f"guilds {args.guilds}, users per guild {args.users}, target {args.rate} msg/s")
+    print(f"handled       {handled / elapsed:10.1f} msg/s")
+    print(f"mongo ops     {(mongo_after - mongo_before) / handled:10.2f} per message")
+    print(f"redis ops     {(redis_after - redis_before) / handled:10.2f} per message")
+    print(f"latency p50   {percentile(latencies, 0.5):10.2f} ms")
+    print(f"latency p99   {percentile(latencies, 0.99):10.2f} ms")
+    print(f"queue depth   {statistics.mean(depths or [0]):10.1f} mean, {max(depths or [0])} max")
+    print(f"bot messages  {sum(x.channel.sent for x in guilds):10d}")
+    print(f"errors        {errors:10d}")
+
+    await bot.redis.flushdb()
+    await bot.mongo.db.client.drop_database(CONFIG.DATABASE_NAME)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Spawning cog load simulator")
+    parser.add_argument("--guilds", type=int, default=100)
+    parser.add_argument("--users", type=int, default=20, help="users per guild")
+    parser.add_argument("--rate", type=float, default=200, help="messages per second")
+    parser.add_argument("--duration", type=float, default=30, help="seconds")
+    parser.add_argument("--catch-rate", type=float, default=0.05, help="share of catches")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
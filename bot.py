@@ -8,6 +8,7 @@ from discord.ext import commands
 
 import cogs
 import helpers
+from helpers.cache import LRUCache
 
 
 uvloop.install()
@@ -45,6 +46,11 @@ class ClusterBot(commands.AutoShardedBot):
         self.ready = False
         self.menus = {}
 
+        # Whether recent messages invoke a command, so that each message is only parsed once
+        # however many listeners need to know
+
+        self.parsed_messages = LRUCache(maxsize=1000, ttl=60)
+
         loop = asyncio.new_event_loop()
         asyncio.set_event_loop(loop)
         super().__init__(**kwargs, loop=loop, command_prefix=determine_prefix)
@@ -122,12 +128,39 @@ class ClusterBot(commands.AutoShardedBot):
     async def on_shard_ready(self, shard_id):
         self.log.info(f"[Cluster#{self.cluster_name}] Shard {shard_id} ready")
 
-    async def on_message(self, message: discord.Message):
+    async def parse_command(self, message: discord.Message):
         message.content = (
             message.content.replace("—", "--").replace("'", "′").replace("‘", "′").replace("’", "′")
         )
 
-        await self.process_commands(message)
+        # Most messages aren't commands, and checking the prefix is much cheaper than
+        # building a context and looking up the command
+
+        prefixes = await self.get_prefix(message)
+        if isinstance(prefixes, str):
+            prefixes = (prefixes,)
+        if not message.content.startswith(tuple(prefixes)):
+            return None
+
+        ctx = await self.get_context(message)
+        return ctx if ctx.valid else None
+
+    async def get_command_context(self, message: discord.Message):
+        """Returns the context of a message if it invokes a command, or None otherwise."""
+
+        task = self.parsed_messages.get(message.id)
+        if task is None:
+            task = self.loop.create_task(self.parse_command(message))
+            self.parsed_messages[message.id] = task
+        return await asyncio.shield(task)
+
+    async def on_message(self, message: discord.Message):
+        if message.author.bot:
+            return
+
+        ctx = await self.get_command_context(message)
+        if ctx is not None:
+            await self.invoke(ctx)
 
     async def before_identify_hook(self, shard_id, *, initial=False):
         async with RedisLock(self.redis, f"identify:{shard_id % 16}", 5, None):
@@ -135,6 +168,14 @@ class ClusterBot(commands.AutoShardedBot):
 
     async def close(self):
         self.log.info("shutting down")
+
+        spawning = self.get_cog("Spawning")
+        if spawning is not None:
+            try:
+                await spawning.xp.flush()
+            except Exception:
+                self.log.exception("Failed to flush XP on shutdown")
+
         await super().close()
 
     async def reload_modules(self):
@@ -28,7 +28,7 @@ class Administration(commands.Cog):
             {"_id": {"$in": [x.id for x in users]}},
             {"$set": {"suspended": True, "suspension_reason": reason}},
         )
-        await self.bot.redis.hdel("db:member", *[int(x.id) for x in users])
+        await self.bot.mongo.invalidate_member(*users)
         users_msg = ", ".join(f"**{x}**" for x in users)
         await ctx.send(f"Suspended {users_msg}.")
 
@@ -41,7 +41,7 @@ class Administration(commands.Cog):
             {"_id": {"$in": [x.id for x in users]}},
             {"$unset": {"suspended": 1, "suspension_reason": 1}},
         )
-        await self.bot.redis.hdel("db:member", *[int(x.id) for x in users])
+        await self.bot.mongo.invalidate_member(*users)
         users_msg = ", ".join(f"**{x}**" for x in users)
         await ctx.send(f"Unsuspended {users_msg}.")
 
@@ -184,6 +184,173 @@ class Administration(commands.Cog):
         await self.bot.mongo.db.pokemon.insert_many(pokemon)
         await ctx.send(f"Gave **{user}** {num} pokémon.")
 
+    @commands.is_owner()
+    @admin.command(aliases=("lat",))
+    async def latency(self, ctx):
+        """View per-stage latency of catches and XP writes on this cluster."""
+
+        spawning = self.bot.get_cog("Spawning")
+        stats = spawning.catch_latency.stats()
+        xp = spawning.xp.stats()
+
+        embed = self.bot.Embed(color=0xFE9AC9, title="Catch Latency")
+        for stage, x in stats.items():
+            embed.add_field(
+                name=stage,
+                value=(
+                    f"**p50:** {x['p50_ms']:.1f} ms\n"
+                    f"**p95:** {x['p95_ms']:.1f} ms\n"
+                    f"**max:** {x['max_ms']:.1f} ms\n"
+                    f"**n:** {x['count']}"
+                ),
+            )
+
+        embed.add_field(
+            name="XP Writes",
+            value=(
+                f"**pending:** {xp['pending']}\n"
+                f"**last batch:** {xp['last_batch_size']} after {xp['last_interval']:.1f} s\n"
+                f"**flushes:** {xp['flushes']}\n"
+                f"**coalescing:** {xp['coalescing_ratio']:.2f} increments per write"
+            ),
+        )
+
+        await ctx.send(embed=embed)
+
+    @commands.is_owner()
+    @admin.command(aliases=("sq",))
+    async def spawnqueue(self, ctx):
+        """View the spawn queue of this cluster."""
+
+        stats = await self.bot.get_cog("Spawning").spawn_stats()
+
+        embed = self.bot.Embed(color=0xFE9AC9, title="Spawn Queue")
+        embed.add_field(name="Queued", value=str(stats["depth"]))
+        embed.add_field(name="In Progress", value=str(stats["in_flight"]))
+        embed.add_field(name="Cluster Tokens", value=f"{stats['controller']['tokens']:.1f}")
+        embed.add_field(name="Guilds", value=str(stats["controller"]["guilds"]))
+        embed.add_field(name="Throttled", value=str(stats["controller"]["denied"]))
+
+        rates = sorted(stats["rates"].items(), key=lambda x: x[1], reverse=True)[:10]
+        embed.add_field(
+            name="Busiest Guilds",
+            value="\n".join(f"`{k}` {v:.1f}/h" for k, v in rates) or "None",
+            inline=False,
+        )
+        for stage, x in stats["latency"].items():
+            embed.add_field(
+                name=stage,
+                value=(
+                    f"**p50:** {x['p50_ms']:.1f} ms\n"
+                    f"**p95:** {x['p95_ms']:.1f} ms\n"
+                    f"**max:** {x['max_ms']:.1f} ms\n"
+                    f"**n:** {x['count']}"
+                ),
+                inline=False,
+            )
+
+        await ctx.send(embed=embed)
+
+    @commands.is_owner()
+    @admin.command(aliases=("ic",))
+    async def imagecache(self, ctx):
+        """View the spawn image cache of this cluster."""
+
+        stats = self.bot.get_cog("Spawning").image_stats()
+
+        embed = self.bot.Embed(color=0xFE9AC9, title="Spawn Image Cache")
+        embed.add_field(name="Size", value=f"{stats['size']}/{stats['maxsize']}")
+        embed.add_field(
+            name="Memory",
+            value=f"{stats['bytes'] / 1048576:.1f}/{stats['maxbytes'] / 1048576:.0f} MiB",
+        )
+        embed.add_field(name="Hit Rate", value=f"{stats['hit_rate']:.1%}")
+        embed.add_field(name="Requests Saved", value=str(stats["hits"]))
+        embed.add_field(name="Time Saved", value=f"{stats['saved_ms'] / 1000:.1f} s")
+        for stage, x in stats["latency"].items():
+            embed.add_field(
+                name=stage,
+                value=(
+                    f"**p50:** {x['p50_ms']:.1f} ms\n"
+                    f"**p95:** {x['p95_ms']:.1f} ms\n"
+                    f"**n:** {x['count']}"
+                ),
+                inline=False,
+            )
+
+        await ctx.send(embed=embed)
+
+    @commands.is_owner()
+    @admin.command(aliases=("act",))
+    async def activity(self, ctx):
+        """View the size of the spawning cooldown and activity maps on this cluster."""
+
+        stats = self.bot.get_cog("Spawning").activity_stats()
+
+        embed = self.bot.Embed(color=0xFE9AC9, title="Activity")
+        for name, x in stats.items():
+            embed.add_field(
+                name=name,
+                value=(
+                    f"**Entries:** {x['size']}\n"
+                    f"**Evicted:** {x['evictions']}\n"
+                    f"**Memory:** {x['memory'] / 1024:.0f} KiB"
+                ),
+            )
+
+        await ctx.send(embed=embed)
+
+    @commands.is_owner()
+    @admin.command(aliases=("rc",))
+    async def reconcilecounters(self, ctx, batch_size: int = 1000):
+        """Recompute the profile counters of every member from their pokédex."""
+
+        await ctx.send("Reconciling profile counters, this might take a while...")
+        num = await self.bot.mongo.reconcile_pokedex_counters(batch_size)
+        await ctx.send(f"Updated the counters of {num} members.")
+
+    @commands.is_owner()
+    @admin.command(aliases=("indices",))
+    async def indexes(self, ctx):
+        """Create missing indexes and check that registered queries use them."""
+
+        async with ctx.typing():
+            created, unknown = await self.bot.mongo.reconcile_indexes()
+            builds = await self.bot.mongo.fetch_index_builds()
+            queries = await self.bot.mongo.explain_index_queries()
+
+        embed = self.bot.Embed(color=0xFE9AC9, title="Indexes")
+
+        embed.add_field(
+            name="Created",
+            value="\n".join(f"`{c}` {n}" for c, n in created) or "None",
+            inline=False,
+        )
+        embed.add_field(
+            name="Unregistered",
+            value="\n".join(f"`{c}` {n}" for c, n in unknown) or "None",
+            inline=False,
+        )
+        embed.add_field(
+            name="Building",
+            value="\n".join(
+                f"`{x['ns']}` {x['done']}/{x['total']}" if x["total"] else f"`{x['ns']}` {x['msg']}"
+                for x in builds
+            )
+            or "None",
+            inline=False,
+        )
+        embed.add_field(
+            name="Queries",
+            value="\n".join(
+                f"{'✅' if ok else '❌'} `{c}` {', '.join(q)}{' by ' + s[0][0] if s else ''}"
+                for c, q, s, ok in queries
+            ),
+            inline=False,
+        )
+
+        await ctx.send(embed=embed)
+
 
 def setup(bot: commands.Bot):
     bot.add_cog(Administration(bot))
@@ -1,4 +1,5 @@
 import asyncio
+import functools
 from itertools import starmap
 
 from discord.errors import HTTPException
@@ -285,6 +286,7 @@ class Auctions(commands.Cog):
             }
         )
         await self.bot.mongo.db.pokemon.delete_one({"_id": pokemon.id})
+        await self.bot.mongo.invalidate_pokemon_count(ctx.author)
 
         await auction_channel.send(embed=embed)
         await ctx.send(
@@ -553,17 +555,14 @@ class Auctions(commands.Cog):
                     f"{converters.strfdelta(x.ends - now, max_len=1)}"
                 )
 
-        count = await self.bot.mongo.fetch_auction_count(ctx.guild, aggregations)
-        pokemon = self.bot.mongo.fetch_auction_list(ctx.guild, aggregations)
-
         pages = pagination.ContinuablePages(
-            pagination.AsyncListPageSource(
-                pokemon,
+            pagination.SeekPageSource(
+                functools.partial(self.bot.mongo.fetch_auction_bounds, ctx.guild, aggregations),
+                functools.partial(self.bot.mongo.fetch_auction_seek, ctx.guild, aggregations),
                 title=f"Auctions in {ctx.guild.name}",
                 prepare_page=prepare_page,
                 format_item=format_item,
                 per_page=15,
-                count=count,
             )
         )
         pages.current_page = flags["page"] - 1
@@ -10,6 +10,7 @@ import discord
 from discord.channel import TextChannel
 from discord.ext import commands, flags, tasks
 from helpers import checks, constants, converters
+from helpers.pokedex import Pokedex
 
 GENERAL_CHANNEL_NAMES = {"welcome", "general", "lounge", "chat", "talk", "main"}
 
@@ -24,9 +25,6 @@ class Bot(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
 
-        if not hasattr(self.bot, "prefixes"):
-            self.bot.prefixes = {}
-
         self.post_count.start()
         self.update_status.start()
         self.process_dms.start()
@@ -187,17 +185,11 @@ class Bot(commands.Cog):
 
     async def determine_prefix(self, guild):
         if guild:
-            if guild.id not in self.bot.prefixes:
-                data = await self.bot.mongo.Guild.find_one({"id": guild.id})
-                if data is None:
-                    data = self.bot.mongo.Guild(id=guild.id)
-                    await data.commit()
-
-                self.bot.prefixes[guild.id] = data.prefix
+            data = await self.bot.mongo.fetch_guild(guild)
 
-            if self.bot.prefixes[guild.id] is not None:
+            if data.prefix is not None:
                 return [
-                    self.bot.prefixes[guild.id],
+                    data.prefix,
                     self.bot.user.mention + " ",
                     self.bot.user.mention[:2] + "!" + self.bot.user.mention[2:] + " ",
                 ]
@@ -290,8 +282,7 @@ class Bot(commands.Cog):
                 pass
 
         await self.bot.mongo.db.member.update_many(query, {"$set": {"need_vote_reminder": False}})
-        if len(ids) > 0:
-            await self.bot.redis.hdel("db:member", *[int(x) for x in ids])
+        await self.bot.mongo.invalidate_member(*ids)
 
     @tasks.loop(minutes=1)
     async def post_count(self):
@@ -396,9 +387,14 @@ class Bot(commands.Cog):
                 "selected_id": result.inserted_id,
                 "joined_at": datetime.utcnow(),
                 "next_idx": 2,
+                **Pokedex().to_mongo(),
+                "total_caught": 0,
+                "mythicals_caught": 0,
+                "legendaries_caught": 0,
+                "ubs_caught": 0,
             }
         )
-        await self.bot.redis.hdel("db:member", ctx.author.id)
+        await self.bot.mongo.invalidate_member(ctx.author)
 
         await ctx.send(
             f"Congratulations on entering the world of pokémon! {species} is your first pokémon. Type `{ctx.prefix}info` to view it!"
@@ -415,25 +411,22 @@ class Bot(commands.Cog):
         embed.title = "Trainer Profile"
         embed.set_author(name=str(ctx.author), icon_url=ctx.author.avatar_url)
 
-        pokemon_caught = []
-        pokemon_caught.append(
-            "**Total: **" + str(await self.bot.mongo.fetch_pokedex_sum(ctx.author))
-        )
+        counters = [
+            ("Total", member.total_caught, None),
+            ("Mythical", member.mythicals_caught, self.bot.data.list_mythical),
+            ("Legendary", member.legendaries_caught, self.bot.data.list_legendary),
+            ("Ultra Beast", member.ubs_caught, self.bot.data.list_ub),
+        ]
 
-        for name, filt in (
-            ("Mythical", self.bot.data.list_mythical),
-            ("Legendary", self.bot.data.list_legendary),
-            ("Ultra Beast", self.bot.data.list_ub),
-        ):
-            pokemon_caught.append(
-                f"**{name}: **"
-                + str(
-                    await self.bot.mongo.fetch_pokedex_sum(
-                        ctx.author,
-                        [{"$match": {"k": {"$in": [str(x) for x in filt]}}}],
-                    )
-                )
-            )
+        # Counters are missing until the member has been reconciled
+
+        if any(value is None for _, value, _ in counters):
+            pokedex = await self.bot.mongo.fetch_pokedex(ctx.author)
+            counters = [(name, pokedex.total(filt), filt) for name, _, filt in counters]
+
+        pokemon_caught = []
+        for name, value, _ in counters:
+            pokemon_caught.append(f"**{name}: **" + str(value))
         pokemon_caught.append("**Shiny: **" + str(member.shinies_caught))
 
         embed.add_field(name="Pokémon Caught", value="\n".join(pokemon_caught))
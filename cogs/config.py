@@ -86,15 +86,12 @@ class Configuration(commands.Cog):
 
         if prefix in ("reset", "p!", "P!"):
             await self.bot.mongo.update_guild(ctx.guild, {"$set": {"prefix": None}})
-            self.bot.prefixes[ctx.guild.id] = None
-
             return await ctx.send("Reset prefix to `p!` for this server.")
 
         if len(prefix) > 100:
             return await ctx.send("Prefix must not be longer than 100 characters.")
 
         await self.bot.mongo.update_guild(ctx.guild, {"$set": {"prefix": prefix}})
-        self.bot.prefixes[ctx.guild.id] = prefix
 
         await ctx.send(f"Changed prefix to `{prefix}` for this server.")
 
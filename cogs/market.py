@@ -170,6 +170,7 @@ class Market(commands.Cog):
         )
 
         await self.bot.mongo.db.pokemon.delete_one({"_id": pokemon.id})
+        await self.bot.mongo.invalidate_pokemon_count(ctx.author)
 
         await ctx.send(
             f"Listed your **{pokemon.iv_percentage:.2%} {pokemon.species} "
@@ -1,10 +1,13 @@
-import pickle
+import asyncio
+import functools
 import math
+import pickle
 import random
 from datetime import datetime, timedelta, timezone
 
 import discord
 import pymongo
+from bson import json_util
 from bson.objectid import ObjectId
 from data import models
 from discord.ext import commands
@@ -13,10 +16,144 @@ from suntime import Sun
 from umongo import Document, EmbeddedDocument, Instance, MixinDocument, fields
 
 from helpers import constants
+from helpers.cache import MISSING, LRUCache
+from helpers.pipeline import optimize_pipeline, unwrap_pipeline
+from helpers.pokedex import Pokedex, counters_pipeline
+
+MEMBER_CACHE_SIZE = 10000
+MEMBER_CACHE_TTL = 60
+POKEMON_COUNT_CACHE_TTL = 30
+GUILD_CACHE_SIZE = 10000
+GUILD_CACHE_TTL = 600
+GUILD_PRELOAD_BATCH = 1000
+GUILD_PRELOAD_DELAY = 1
+INVALIDATION_CHANNEL = "db:invalidate"
+IDX_BLOCK_SIZE = 10
+BOUNDS_BATCH_SIZE = 10000
+
+# Keyset pagination
+
+
+def split_sort(aggregations, default_sort):
+    """Splits a pipeline into its filter stages, the active sort key and direction, and
+    the trailing $skip/$limit stages."""
+
+    i = len(aggregations)
+    while i > 0 and ("$skip" in aggregations[i - 1] or "$limit" in aggregations[i - 1]):
+        i -= 1
+
+    body, tail = aggregations[:i], aggregations[i:]
+    sorts = [x["$sort"] for x in body if "$sort" in x]
+    ((key, direction),) = (sorts[-1] if len(sorts) > 0 else default_sort).items()
+
+    return [x for x in body if "$sort" not in x], key, direction, tail
+
+
+def seek_query(key, direction, bound):
+    """Returns a query for the documents from `bound` onwards in the order of key, then
+    _id. The range on key bounds an index on (..., key, _id), and the $nor only filters out
+    the documents before the bound that share its key."""
+
+    gte, lt = ("$gte", "$lt") if direction == 1 else ("$lte", "$gt")
+
+    if key == "_id":
+        return {"_id": {gte: bound["id"]}}
+    return {key: {gte: bound["k"]}, "$nor": [{key: bound["k"], "_id": {lt: bound["id"]}}]}
+
+
+def seek_bounds_pipeline(aggregations, default_sort):
+    """Returns a pipeline of the sort key and _id of every matching document, in order.
+    Page boundaries are picked out while streaming it with collect_bounds, so that they are
+    never gathered into a single document."""
+
+    filters, key, direction, tail = split_sort(aggregations, default_sort)
+    return [
+        *filters,
+        {"$sort": {key: direction, "_id": direction}},
+        *tail,
+        {"$project": {"k": f"${key}"}},
+    ]
+
+
+async def collect_bounds(cursor, per_page):
+    """Returns the number of documents from a cursor over seek_bounds_pipeline and the sort
+    key of the first document of every page."""
+
+    count, bounds = 0, []
+    async for x in cursor:
+        if count % per_page == 0:
+            bounds.append({"k": x.get("k"), "id": x["_id"]})
+        count += 1
+    return count, bounds
+
+
+def pipeline_key(aggregations):
+    """Returns a cache key for a pipeline that is the same for pipelines that only differ in
+    how their stages are split up or ordered where that doesn't change the result."""
+
+    return json_util.dumps(optimize_pipeline(aggregations), sort_keys=True)
+
+
+def seek_page_pipeline(aggregations, default_sort, bound, limit):
+    filters, key, direction, tail = split_sort(aggregations, default_sort)
+    return [
+        *filters,
+        {"$match": seek_query(key, direction, bound)},
+        {"$sort": {key: direction, "_id": direction}},
+        {"$limit": limit},
+    ]
+
+
+# Indexes needed by the hot queries, created on startup by the first cluster. Each query
+# shape is checked with explain to make sure it is served by an index.
+
+INDEXES = {
+    "pokemon": [
+        [("owner_id", 1), ("idx", 1), ("_id", 1)],
+        [("owner_id", 1), ("iv_total", 1), ("_id", 1)],
+        [("owner_id", 1), ("level", 1), ("_id", 1)],
+        [("owner_id", 1), ("species_id", 1), ("_id", 1)],
+    ],
+    "listing": [
+        [("pokemon.species_id", 1), ("price", 1)],
+    ],
+    "auction": [
+        [("guild_id", 1), ("_id", 1)],
+        [("guild_id", 1), ("ends", 1), ("_id", 1)],
+        [("ends", 1)],
+    ],
+    "channel": [
+        [("spawns_remaining", 1)],
+    ],
+}
+
+SEEK_BOUND = {"k": 0, "id": ObjectId("000000000000000000000000")}
+
+INDEX_QUERIES = [
+    *(
+        (
+            "pokemon",
+            {"owner_id": 0, **seek_query(key, direction, SEEK_BOUND)},
+            [(key, direction), ("_id", direction)],
+        )
+        for key, direction in (("idx", 1), ("iv_total", -1), ("level", -1), ("species_id", 1))
+    ),
+    ("pokemon", {"owner_id": 0, "species_id": {"$in": [1, 2, 3]}}, [("idx", 1)]),
+    ("listing", {"pokemon.species_id": {"$in": [1, 2, 3]}}, [("price", 1)]),
+    ("auction", {"guild_id": 0, **seek_query("_id", 1, SEEK_BOUND)}, [("_id", 1)]),
+    (
+        "auction",
+        {"guild_id": 0, **seek_query("ends", 1, SEEK_BOUND)},
+        [("ends", 1), ("_id", 1)],
+    ),
+    ("auction", {"ends": {"$lt": datetime(2000, 1, 1)}}, None),
+    ("channel", {"spawns_remaining": {"$gt": 0}}, None),
+]
 
 random_iv = lambda: random.randint(0, 31)
 random_nature = lambda: random.choice(constants.NATURES)
 
+
 # Instance
 
 
@@ -231,6 +368,131 @@ class EmbeddedPokemon(PokemonBase, EmbeddedDocument):
         strict = False
 
 
+# Read-only records built straight from mongo documents, skipping umongo's deserialization
+# and validation. These are used for lists where each item is only displayed.
+
+
+class PokemonView:
+    __slots__ = (
+        "id",
+        "timestamp",
+        "owner_id",
+        "idx",
+        "species_id",
+        "level",
+        "xp",
+        "nature",
+        "shiny",
+        "iv_hp",
+        "iv_atk",
+        "iv_defn",
+        "iv_satk",
+        "iv_sdef",
+        "iv_spd",
+        "iv_total",
+        "nickname",
+        "favorite",
+        "held_item",
+        "moves",
+        "has_color",
+        "color",
+    )
+
+    _hp = None
+    ailments = None
+    stages = None
+
+    def __init__(self, data):
+        self.id = data.get("_id")
+        self.timestamp = data.get("timestamp")
+        self.owner_id = data.get("owner_id")
+        self.idx = data.get("idx")
+        self.species_id = data["species_id"]
+        self.level = data["level"]
+        self.xp = data["xp"]
+        self.nature = data["nature"]
+        self.shiny = data["shiny"]
+        self.iv_hp = data["iv_hp"]
+        self.iv_atk = data["iv_atk"]
+        self.iv_defn = data["iv_defn"]
+        self.iv_satk = data["iv_satk"]
+        self.iv_sdef = data["iv_sdef"]
+        self.iv_spd = data["iv_spd"]
+        self.iv_total = data.get("iv_total")
+        self.nickname = data.get("nickname")
+        self.favorite = data.get("favorite", False)
+        self.held_item = data.get("held_item")
+        self.moves = data.get("moves", [])
+        self.has_color = data.get("has_color", False)
+        self.color = data.get("color")
+
+        if self.iv_total is None:
+            self.iv_total = (
+                self.iv_hp + self.iv_atk + self.iv_defn + self.iv_satk + self.iv_sdef + self.iv_spd
+            )
+
+    @classmethod
+    def build_from_mongo(cls, data):
+        return cls(data)
+
+    __format__ = PokemonBase.__format__
+    __str__ = PokemonBase.__str__
+    species = PokemonBase.species
+    max_xp = PokemonBase.max_xp
+    max_hp = PokemonBase.max_hp
+    hp = property(PokemonBase.hp.fget)
+    atk = PokemonBase.atk
+    defn = PokemonBase.defn
+    satk = PokemonBase.satk
+    sdef = PokemonBase.sdef
+    spd = PokemonBase.spd
+    iv_percentage = PokemonBase.iv_percentage
+    get_next_evolution = PokemonBase.get_next_evolution
+
+
+class ListingView:
+    __slots__ = ("id", "pokemon", "user_id", "price")
+
+    def __init__(self, data):
+        self.id = data["_id"]
+        self.pokemon = PokemonView(data["pokemon"])
+        self.user_id = data["user_id"]
+        self.price = data["price"]
+
+    @classmethod
+    def build_from_mongo(cls, data):
+        return cls(data)
+
+
+class AuctionView:
+    __slots__ = (
+        "id",
+        "guild_id",
+        "message_id",
+        "pokemon",
+        "user_id",
+        "current_bid",
+        "bid_increment",
+        "bidder_id",
+        "ends",
+    )
+
+    def __init__(self, data):
+        self.id = data["_id"]
+        self.guild_id = data["guild_id"]
+        self.message_id = data["message_id"]
+        self.pokemon = PokemonView(data["pokemon"])
+        self.user_id = data["user_id"]
+        self.current_bid = data["current_bid"]
+        self.bid_increment = data["bid_increment"]
+        self.bidder_id = data.get("bidder_id")
+        self.ends = data["ends"]
+
+    @classmethod
+    def build_from_mongo(cls, data):
+        return cls(data)
+
+
 class Member(Document):
     class Meta:
         strict = False
@@ -248,7 +510,13 @@ class Member(Document):
 
     # Pokédex
     pokedex = fields.DictField(fields.StringField(), fields.IntegerField(), default=dict)
+    pokedex_counts = fields.ListField(fields.IntegerField(), default=list)
+    pokedex_caught = fields.ListField(fields.IntegerField(), default=list)
     shinies_caught = fields.IntegerField(default=0)
+    total_caught = fields.IntegerField(default=None)
+    mythicals_caught = fields.IntegerField(default=None)
+    legendaries_caught = fields.IntegerField(default=None)
+    ubs_caught = fields.IntegerField(default=None)
 
     # Shop
     balance = fields.IntegerField(default=0)
@@ -340,6 +608,15 @@ class Auction(Document):
     ends = fields.DateTimeField(required=True)
 
 
+@functools.lru_cache(maxsize=4096)
+def sun_times(lat, lng, date):
+    """Returns the UTC sunrise and sunset times on a date. Guilds at the same location share
+    the result, so it's only computed once a day per location."""
+
+    sun = Sun(lat, lng)
+    return sun.get_sunrise_time(date), sun.get_sunset_time(date)
+
+
 class Guild(Document):
     class Meta:
         strict = False
@@ -360,12 +637,11 @@ class Guild(Document):
 
     @property
     def is_day(self):
-        sun = Sun(self.lat, self.lng)
-        sunrise, sunset = sun.get_sunrise_time(), sun.get_sunset_time()
+        now = datetime.now(timezone.utc)
+        sunrise, sunset = sun_times(self.lat, self.lng, now.date())
         if sunset < sunrise:
             sunset += timedelta(days=1)
 
-        now = datetime.now(timezone.utc)
         return (
             sunrise < now < sunset
             or sunrise < now + timedelta(days=1) < sunset
@@ -429,26 +705,256 @@ class Mongo(commands.Cog):
             setattr(self, x, instance.register(g[x]))
             getattr(self, x).bot = bot
 
+        for x in ("PokemonView", "ListingView", "AuctionView"):
+            setattr(self, x, g[x])
+            getattr(self, x).bot = bot
+
+        # Members are cached in this process in front of the shared redis hash. Every
+        # cluster drops its copy when an invalidation is published for that member.
+
+        self.member_cache = LRUCache(maxsize=MEMBER_CACHE_SIZE, ttl=MEMBER_CACHE_TTL)
+        self.member_invalidations = LRUCache(maxsize=MEMBER_CACHE_SIZE)
+
+        # Per-user counts of pokémon matching a filter, keyed by the normalized pipeline.
+        # These are invalidated on every cluster the same way as members.
+
+        self.pokemon_counts = LRUCache(maxsize=MEMBER_CACHE_SIZE, ttl=POKEMON_COUNT_CACHE_TTL)
+        self.pokemon_bounds = LRUCache(maxsize=MEMBER_CACHE_SIZE, ttl=POKEMON_COUNT_CACHE_TTL)
+        self.pokemon_invalidations = LRUCache(maxsize=MEMBER_CACHE_SIZE)
+
+        # Blocks of idx values reserved for new pokémon, as [next, end) per member
+
+        self.idx_blocks = LRUCache(maxsize=MEMBER_CACHE_SIZE)
+
+        # Guild settings change rarely and are read on nearly every message, so they are
+        # cached the same way as members. The ttl only bounds how long a missed
+        # invalidation can go unnoticed.
+
+        self.guild_cache = LRUCache(maxsize=GUILD_CACHE_SIZE, ttl=GUILD_CACHE_TTL)
+        self.guild_invalidations = LRUCache(maxsize=GUILD_CACHE_SIZE)
+        self.pending_guilds = set()
+        self._preload_task = None
+
+        self._invalidation_task = bot.loop.create_task(self.listen_invalidations())
+
+        if bot.cluster_idx == 0:
+            bot.loop.create_task(self.reconcile_indexes())
+
+    async def reconcile_indexes(self):
+        """Creates any registered index that is missing. Indexes that aren't registered are
+        left alone and only reported, so that nothing is dropped by accident."""
+
+        created, unknown = [], []
+
+        for collection, indexes in INDEXES.items():
+            existing = {
+                tuple(x["key"].items()): x["name"] async for x in self.db[collection].list_indexes()
+            }
+            wanted = {tuple(x) for x in indexes}
+
+            for keys in indexes:
+                if tuple(keys) in existing:
+                    continue
+                try:
+                    name = await self.db[collection].create_index(keys, background=True)
+                except pymongo.errors.PyMongoError:
+                    self.bot.log.exception(f"Couldn't create index {keys} on {collection}")
+                else:
+                    self.bot.log.info(f"Created index {name} on {collection}")
+                    created.append((collection, name))
+
+            for keys, name in existing.items():
+                if keys != (("_id", 1),) and keys not in wanted:
+                    unknown.append((collection, name))
+
+        return created, unknown
+
+    async def fetch_index_builds(self):
+        """Returns the progress of index builds currently running on the server."""
+
+        return [
+            {
+                "ns": x.get("ns"),
+                "msg": x.get("msg"),
+                "done": x.get("progress", {}).get("done"),
+                "total": x.get("progress", {}).get("total"),
+            }
+            async for x in self.db.client.admin.aggregate(
+                [
+                    {"$currentOp": {"allUsers": True, "idleConnections": False}},
+                    {"$match": {"command.createIndexes": {"$exists": True}}},
+                ]
+            )
+        ]
+
+    async def explain_index_queries(self):
+        """Returns each registered query shape along with whether its winning plan avoids
+        both a collection scan and a blocking sort."""
+
+        def stages(plan):
+            yield plan.get("stage")
+            if "inputStage" in plan:
+                yield from stages(plan["inputStage"])
+            for x in plan.get("inputStages", []):
+                yield from stages(x)
+
+        result = []
+
+        for collection, query, sort in INDEX_QUERIES:
+            cursor = self.db[collection].find(query)
+            if sort is not None:
+                cursor = cursor.sort(sort)
+            plan = (await cursor.explain())["queryPlanner"]["winningPlan"]
+            plan = plan.get("queryPlan", plan)
+            names = set(stages(plan))
+            result.append((collection, query, sort, not names & {"COLLSCAN", "SORT"}))
+
+        return result
+
+    async def listen_invalidations(self):
+        await self.bot.get_cog("Redis").wait_until_ready()
+
+        while True:
+            try:
+                (channel,) = await self.bot.redis.subscribe(INVALIDATION_CHANNEL)
+                async for message in channel.iter(encoding="utf-8"):
+                    kind, _, ids = message.partition(":")
+                    if kind == "member":
+                        self.evict_members(*(int(x) for x in ids.split(",")))
+                    elif kind == "guild":
+                        self.evict_guilds(*(int(x) for x in ids.split(",")))
+                    elif kind == "pokemon":
+                        self.evict_pokemon_counts(*(int(x) for x in ids.split(",")))
+                    elif kind == "idx":
+                        cluster, _, ids = ids.partition(":")
+                        if int(cluster) != self.bot.cluster_idx:
+                            for x in ids.split(","):
+                                self.idx_blocks.pop(int(x))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self.bot.log.exception("Invalidation listener failed, resubscribing")
+
+            # Anything could have changed while we weren't listening
+
+            self.member_cache.clear()
+            self.guild_cache.clear()
+            self.pokemon_counts.clear()
+            self.pokemon_bounds.clear()
+            self.idx_blocks.clear()
+            await asyncio.sleep(1)
+
+    def evict_members(self, *ids):
+        for i in ids:
+            self.member_cache.pop(i)
+            self.member_invalidations[i] = self.member_invalidations.get(i, 0, count=False) + 1
+
+    async def invalidate_member(self, *members, pipe=None):
+        """Drops members from every cache. If a redis pipeline is given, the commands are
+        added to it and the caller is responsible for executing it."""
+
+        ids = [int(getattr(x, "id", x)) for x in members]
+        if len(ids) == 0:
+            return
+
+        self.evict_members(*ids)
+
+        execute = pipe is None
+        if execute:
+            pipe = self.bot.redis.pipeline()
+
+        pipe.hdel("db:member", *ids)
+        pipe.publish(INVALIDATION_CHANNEL, "member:" + ",".join(str(x) for x in ids))
+
+        if execute:
+            await pipe.execute()
+
     async def fetch_member_info(self, member: discord.Member):
+        val = self.member_cache.get(member.id, MISSING)
+        if val is not MISSING:
+            return val
+
+        version = self.member_invalidations.get(member.id, 0, count=False)
+
         val = await self.bot.redis.hget(f"db:member", member.id)
         if val is None:
-            val = await self.Member.find_one({"id": member.id}, {"pokemon": 0, "pokedex": 0})
+            val = await self.Member.find_one(
+                {"id": member.id},
+                {"pokemon": 0, "pokedex": 0, "pokedex_counts": 0, "pokedex_caught": 0},
+            )
             v = "" if val is None else pickle.dumps(val.to_mongo())
             await self.bot.redis.hset(f"db:member", member.id, v)
         elif len(val) == 0:
-            return None
+            val = None
         else:
             val = self.Member.build_from_mongo(pickle.loads(val))
+
+        # Don't cache something that was invalidated while we were fetching it
+
+        if self.member_invalidations.get(member.id, 0, count=False) == version:
+            self.member_cache[member.id] = val
+
         return val
 
+    async def drop_idx_blocks(self, *members, pipe=None):
+        """Drops the idx blocks held for members on every cluster. This must be done
+        whenever next_idx is set rather than incremented in the database, so that no
+        cluster hands out numbers that are used again. If a redis pipeline is given, the
+        caller executes it."""
+
+        ids = [int(getattr(x, "id", x)) for x in members]
+        if len(ids) == 0:
+            return
+
+        for i in ids:
+            self.idx_blocks.pop(i)
+
+        message = f"idx:{self.bot.cluster_idx}:" + ",".join(str(x) for x in ids)
+
+        if pipe is None:
+            await self.bot.redis.publish(INVALIDATION_CHANNEL, message)
+        else:
+            pipe.publish(INVALIDATION_CHANNEL, message)
+
+    def take_block_idx(self, member: discord.Member, reserve=1):
+        """Returns the first of `reserve` consecutive idx values from the block held for a
+        member on this cluster, or None if it doesn't have enough left."""
+
+        block = self.idx_blocks.get(member.id)
+        if block is None or block[1] - block[0] < reserve:
+            return None
+
+        block[0] += reserve
+        if block[0] == block[1]:
+            self.idx_blocks.pop(member.id)
+        return block[0] - reserve
+
     async def fetch_next_idx(self, member: discord.Member, reserve=1):
+        """Returns the first of `reserve` consecutive idx values for new pokémon. Values are
+        handed out from a block reserved in advance when possible, so most pokémon don't
+        need a write to the member. Values reserved with $inc never overlap, so blocks held
+        by other clusters are kept, and a block that is too small for a request is kept for
+        the next one instead of being replaced. Values are only lost if a cluster stops or
+        forgets a member while holding its block, and reindex removes those gaps."""
+
+        await self.invalidate_pokemon_count(member)
+
+        if (idx := self.take_block_idx(member, reserve)) is not None:
+            return idx
+
+        size = reserve if member.id in self.idx_blocks else max(reserve, IDX_BLOCK_SIZE)
         result = await self.db.member.find_one_and_update(
             {"_id": member.id},
-            {"$inc": {"next_idx": reserve}},
+            {"$inc": {"next_idx": size}},
             projection={"next_idx": 1},
         )
-        await self.bot.redis.hdel(f"db:member", member.id)
-        return result["next_idx"]
+        await self.invalidate_member(member)
+
+        start = result["next_idx"]
+        if size > reserve:
+            self.idx_blocks[member.id] = [start + reserve, start + size]
+
+        return start
 
     async def reset_idx(self, member: discord.Member, value):
         result = await self.db.member.find_one_and_update(
@@ -456,107 +962,206 @@ class Mongo(commands.Cog):
             {"$set": {"next_idx": value}},
             projection={"next_idx": 1},
         )
-        await self.bot.redis.hdel(f"db:member", member.id)
+
+        pipe = self.bot.redis.pipeline()
+        await self.drop_idx_blocks(member, pipe=pipe)
+        await self.invalidate_member(member, pipe=pipe)
+        await self.invalidate_pokemon_count(member, pipe=pipe)
+        await pipe.execute()
         return result["next_idx"]
 
-    async def fetch_pokedex(self, member: discord.Member, start: int, end: int):
+    async def fetch_pokedex(self, member: discord.Member):
+        result = await self.db.member.find_one(
+            {"_id": member.id}, {"pokedex_counts": 1, "pokedex_caught": 1}
+        )
+        if result is None:
+            return Pokedex()
 
-        filter_obj = {}
+        if (pokedex := Pokedex.from_mongo(result)) is not None:
+            return pokedex
 
-        for i in range(start, end):
-            filter_obj[f"pokedex.{i}"] = 1
+        # Not backfilled yet, fall back to the pokedex dict
 
-        return await self.Member.find_one({"id": member.id}, filter_obj)
+        result = await self.db.member.find_one({"_id": member.id}, {"pokedex": 1})
+        return Pokedex.from_dict(result.get("pokedex", {}))
 
     async def fetch_market_list(self, aggregations=[]):
-        async for x in self.db.listing.aggregate(aggregations, allowDiskUse=True):
-            yield self.bot.mongo.Listing.build_from_mongo(x)
-
-    async def fetch_auction_list(self, guild, aggregations=[]):
-        async for x in self.db.auction.aggregate(
-            [
-                {"$match": {"guild_id": guild.id}},
-                *aggregations,
-            ],
-            allowDiskUse=True,
+        async for x in self.db.listing.aggregate(
+            optimize_pipeline(aggregations), allowDiskUse=True
         ):
-            yield self.bot.mongo.Auction.build_from_mongo(x)
+            yield self.ListingView.build_from_mongo(x)
 
-    async def fetch_auction_count(self, guild, aggregations=[]):
+    def auction_pipeline(self, guild, aggregations=[]):
+        return optimize_pipeline([{"$match": {"guild_id": guild.id}}, *aggregations])
 
-        result = await self.db.auction.aggregate(
-            [
-                {"$match": {"guild_id": guild.id}},
-                *aggregations,
-                {"$count": "num_matches"},
-            ],
+    async def fetch_auction_bounds(self, guild, aggregations=[], per_page=20):
+        cursor = self.db.auction.aggregate(
+            self.auction_pipeline(guild, seek_bounds_pipeline(aggregations, {"_id": 1})),
             allowDiskUse=True,
-        ).to_list(None)
+            batchSize=BOUNDS_BATCH_SIZE,
+        )
+        return await collect_bounds(cursor, per_page)
 
-        if len(result) == 0:
-            return 0
+    async def fetch_auction_seek(self, guild, aggregations, bound, limit):
+        return [
+            self.AuctionView.build_from_mongo(x)
+            async for x in self.db.auction.aggregate(
+                [
+                    *self.auction_pipeline(
+                        guild, seek_page_pipeline(aggregations, {"_id": 1}, bound, limit)
+                    ),
+                ],
+                allowDiskUse=True,
+            )
+        ]
 
-        return result[0]["num_matches"]
+    def pokemon_pipeline(self, member: discord.Member, aggregations=[]):
+        """Returns a pipeline of documents of the form {pokemon, idx} going through
+        `aggregations`. Leading filters, sorts, skips and limits are rewritten to run before
+        the projection so that they can use the indexes on the pokemon collection."""
+
+        head, rest = unwrap_pipeline(
+            optimize_pipeline(aggregations), prefix="pokemon.", keep=("_id", "idx")
+        )
+        return [
+            *optimize_pipeline([{"$match": {"owner_id": member.id}}, {"$sort": {"idx": 1}}, *head]),
+            {"$project": {"pokemon": "$$ROOT", "idx": "$idx"}},
+            *rest,
+        ]
 
     async def fetch_pokemon_list(self, member: discord.Member, aggregations=[]):
         async for x in self.db.pokemon.aggregate(
             [
-                {"$match": {"owner_id": member.id}},
-                {"$sort": {"idx": 1}},
-                {"$project": {"pokemon": "$$ROOT", "idx": "$idx"}},
-                *aggregations,
+                *self.pokemon_pipeline(member, aggregations),
                 {"$replaceRoot": {"newRoot": "$pokemon"}},
             ],
             allowDiskUse=True,
         ):
             yield self.bot.mongo.Pokemon.build_from_mongo(x)
 
-    async def fetch_pokemon_count(self, member: discord.Member, aggregations=[]):
+    async def fetch_pokemon_page(self, member: discord.Member, aggregations=[], limit=20):
+        """Returns the number of matching pokémon and the first `limit` of them, using a
+        single $facet query unless the count is already cached."""
+
+        key = pipeline_key(aggregations)
+        counts = self.pokemon_counts.get(member.id)
+        version = self.pokemon_invalidations.get(member.id, 0, count=False)
+
+        if counts is not None and key in counts:
+            page = await self.db.pokemon.aggregate(
+                [
+                    *self.pokemon_pipeline(member, [*aggregations, {"$limit": limit}]),
+                    {"$replaceRoot": {"newRoot": "$pokemon"}},
+                ],
+                allowDiskUse=True,
+            ).to_list(None)
+            return counts[key], [self.PokemonView.build_from_mongo(x) for x in page]
 
         result = await self.db.pokemon.aggregate(
             [
-                {"$match": {"owner_id": member.id}},
-                {"$project": {"pokemon": "$$ROOT"}},
-                *aggregations,
-                {"$count": "num_matches"},
+                *self.pokemon_pipeline(member, aggregations),
+                {
+                    "$facet": {
+                        "count": [{"$count": "num_matches"}],
+                        "page": [{"$limit": limit}, {"$replaceRoot": {"newRoot": "$pokemon"}}],
+                    }
+                },
             ],
             allowDiskUse=True,
         ).to_list(None)
 
-        if len(result) == 0:
-            return 0
+        count = result[0]["count"][0]["num_matches"] if result[0]["count"] else 0
 
-        return result[0]["num_matches"]
+        # Don't cache something that was invalidated while we were fetching it
+
+        if self.pokemon_invalidations.get(member.id, 0, count=False) == version:
+            if counts is None:
+                counts = {}
+                self.pokemon_counts[member.id] = counts
+            counts[key] = count
+
+        return count, [self.PokemonView.build_from_mongo(x) for x in result[0]["page"]]
+
+    async def fetch_pokemon_bounds(self, member: discord.Member, aggregations=[], per_page=20):
+        """Returns the number of matching pokémon and the sort key of the first pokémon on
+        every page, so that any page can be fetched with a single range query."""
+
+        key = (per_page, pipeline_key(aggregations))
+        bounds = self.pokemon_bounds.get(member.id)
+        version = self.pokemon_invalidations.get(member.id, 0, count=False)
+
+        if bounds is not None and key in bounds:
+            return bounds[key]
+
+        cursor = self.db.pokemon.aggregate(
+            self.pokemon_pipeline(member, seek_bounds_pipeline(aggregations, {"idx": 1})),
+            allowDiskUse=True,
+            batchSize=BOUNDS_BATCH_SIZE,
+        )
+        result = await collect_bounds(cursor, per_page)
+
+        if self.pokemon_invalidations.get(member.id, 0, count=False) == version:
+            if bounds is None:
+                bounds = {}
+                self.pokemon_bounds[member.id] = bounds
+            bounds[key] = result
+
+        return result
+
+    async def fetch_pokemon_seek(self, member: discord.Member, aggregations, bound, limit):
+        return [
+            self.PokemonView.build_from_mongo(x)
+            async for x in self.db.pokemon.aggregate(
+                [
+                    *self.pokemon_pipeline(
+                        member, seek_page_pipeline(aggregations, {"idx": 1}, bound, limit)
+                    ),
+                    {"$replaceRoot": {"newRoot": "$pokemon"}},
+                ],
+                allowDiskUse=True,
+            )
+        ]
 
-    async def fetch_pokedex_count(self, member: discord.Member, aggregations=[]):
+    async def fetch_pokemon_docs(self, member: discord.Member, aggregations=[], fields=()):
+        """Returns the raw documents of matching pokémon, keeping only _id and `fields`."""
 
-        result = await self.db.member.aggregate(
+        return await self.db.pokemon.aggregate(
             [
-                {"$match": {"_id": member.id}},
-                {"$project": {"pokedex": {"$objectToArray": "$pokedex"}}},
-                {"$unwind": {"path": "$pokedex"}},
-                {"$replaceRoot": {"newRoot": "$pokedex"}},
-                *aggregations,
-                {"$group": {"_id": "count", "result": {"$sum": 1}}},
+                *self.pokemon_pipeline(member, aggregations),
+                {"$project": {"_id": 1, **{x: f"$pokemon.{x}" for x in fields}}},
             ],
             allowDiskUse=True,
         ).to_list(None)
 
-        if len(result) == 0:
-            return 0
+    def evict_pokemon_counts(self, *ids):
+        for i in ids:
+            self.pokemon_counts.pop(i)
+            self.pokemon_bounds.pop(i)
+            self.pokemon_invalidations[i] = self.pokemon_invalidations.get(i, 0, count=False) + 1
+
+    async def invalidate_pokemon_count(self, *members, pipe=None):
+        """Drops the cached counts and page bounds of members' pokémon on every cluster. If
+        a redis pipeline is given, the command is added to it and the caller is responsible
+        for executing it."""
 
-        return result[0]["result"]
+        ids = [int(getattr(x, "id", x)) for x in members]
+        if len(ids) == 0:
+            return
 
-    async def fetch_pokedex_sum(self, member: discord.Member, aggregations=[]):
+        self.evict_pokemon_counts(*ids)
+        message = "pokemon:" + ",".join(str(x) for x in ids)
 
-        result = await self.db.member.aggregate(
+        if pipe is None:
+            await self.bot.redis.publish(INVALIDATION_CHANNEL, message)
+        else:
+            pipe.publish(INVALIDATION_CHANNEL, message)
+
+    async def fetch_pokemon_count(self, member: discord.Member, aggregations=[]):
+
+        result = await self.db.pokemon.aggregate(
             [
-                {"$match": {"_id": member.id}},
-                {"$project": {"pokedex": {"$objectToArray": "$pokedex"}}},
-                {"$unwind": {"path": "$pokedex"}},
-                {"$replaceRoot": {"newRoot": "$pokedex"}},
-                *aggregations,
-                {"$group": {"_id": "sum", "result": {"$sum": "$v"}}},
+                *self.pokemon_pipeline(member, aggregations),
+                {"$count": "num_matches"},
             ],
             allowDiskUse=True,
         ).to_list(None)
@@ -564,23 +1169,54 @@ class Mongo(commands.Cog):
         if len(result) == 0:
             return 0
 
-        return result[0]["result"]
+        return result[0]["num_matches"]
+
+    async def reconcile_pokedex_counters(self, batch_size=1000):
+        """Recomputes the profile counters of every backfilled member from pokedex_counts,
+        one range of member ids at a time."""
+
+        query, total = {}, 0
+
+        while True:
+            ids = [
+                x["_id"]
+                async for x in self.db.member.find(query, {"_id": 1}).sort("_id").limit(batch_size)
+            ]
+            if len(ids) == 0:
+                return total
+
+            result = await self.db.member.update_many(
+                {"_id": {"$in": ids}, "pokedex_counts": {"$type": "array"}},
+                counters_pipeline(self.bot.data),
+            )
+            await self.invalidate_member(*ids)
+
+            total += result.modified_count
+            query = {"_id": {"$gt": ids[-1]}}
 
     async def update_member(self, member, update):
         if hasattr(member, "id"):
             member = member.id
         result = await self.db.member.update_one({"_id": member}, update)
-        await self.bot.redis.hdel(f"db:member", int(member))
+        await self.invalidate_member(member)
         return result
 
     async def update_pokemon(self, pokemon, update):
+        """Updates a pokémon and drops its owner's cached counts and page bounds, since the
+        update may change which filters it matches and where it sorts."""
+
         if hasattr(pokemon, "id"):
             pokemon = pokemon.id
         if hasattr(pokemon, "_id"):
             pokemon = pokemon._id
         if isinstance(pokemon, dict) and "_id" in pokemon:
             pokemon = pokemon["_id"]
-        return await self.db.pokemon.update_one({"_id": pokemon}, update)
+        result = await self.db.pokemon.find_one_and_update(
+            {"_id": pokemon}, update, projection={"owner_id": 1}
+        )
+        if result is not None:
+            await self.invalidate_pokemon_count(result["owner_id"])
+        return result
 
     async def fetch_pokemon(self, member: discord.Member, idx: int):
         if isinstance(idx, ObjectId):
@@ -608,7 +1244,81 @@ class Mongo(commands.Cog):
 
         return self.Pokemon.build_from_mongo(result)
 
+    def evict_guilds(self, *ids):
+        for i in ids:
+            self.guild_cache.pop(i)
+            self.guild_invalidations[i] = self.guild_invalidations.get(i, 0, count=False) + 1
+
+    async def invalidate_guild(self, *guilds):
+        """Drops guilds from the settings cache of every cluster."""
+
+        ids = [int(getattr(x, "id", x)) for x in guilds]
+        if len(ids) == 0:
+            return
+
+        self.evict_guilds(*ids)
+        await self.bot.redis.publish(INVALIDATION_CHANNEL, "guild:" + ",".join(str(x) for x in ids))
+
+    async def preload_guilds(self, *guilds, batch_size=GUILD_PRELOAD_BATCH):
+        """Loads the settings of guilds that aren't cached yet with one query per batch,
+        creating the documents of guilds that don't have one, so that a cluster that was
+        just started doesn't need a query for the first message in each guild."""
+
+        ids = [x for x in (int(getattr(g, "id", g)) for g in guilds) if x not in self.guild_cache]
+
+        for i in range(0, len(ids), batch_size):
+            batch = ids[i : i + batch_size]
+            versions = {x: self.guild_invalidations.get(x, 0, count=False) for x in batch}
+
+            found = {x.id: x async for x in self.Guild.find({"id": {"$in": batch}})}
+            missing = [self.Guild(id=x) for x in batch if x not in found]
+
+            if len(missing) > 0:
+                try:
+                    await self.db.guild.insert_many([x.to_mongo() for x in missing], ordered=False)
+                except pymongo.errors.BulkWriteError as e:
+                    # Guilds created meanwhile are loaded the next time they're needed
+
+                    failed = {x["index"] for x in e.details["writeErrors"]}
+                    missing = [x for i, x in enumerate(missing) if i not in failed]
+
+            for g in (*found.values(), *missing):
+                if self.guild_invalidations.get(g.id, 0, count=False) == versions[g.id]:
+                    self.guild_cache[g.id] = g
+
+    async def preload_pending_guilds(self):
+        await asyncio.sleep(GUILD_PRELOAD_DELAY)
+        guilds, self.pending_guilds = self.pending_guilds, set()
+        self._preload_task = None
+
+        try:
+            await self.preload_guilds(*guilds)
+        except pymongo.errors.PyMongoError:
+            self.bot.log.exception("Couldn't preload guilds")
+
+    @commands.Cog.listener()
+    async def on_guild_available(self, guild: discord.Guild):
+        # Guilds become available one by one as shards connect, so they are collected
+        # for a moment and loaded together
+
+        self.pending_guilds.add(guild.id)
+        if self._preload_task is None:
+            self._preload_task = self.bot.loop.create_task(self.preload_pending_guilds())
+
+    @commands.Cog.listener()
+    async def on_shard_ready(self, shard_id):
+        try:
+            await self.preload_guilds(*(x for x in self.bot.guilds if x.shard_id == shard_id))
+        except pymongo.errors.PyMongoError:
+            self.bot.log.exception(f"Couldn't preload guilds of shard {shard_id}")
+
     async def fetch_guild(self, guild: discord.Guild):
+        g = self.guild_cache.get(guild.id)
+        if g is not None:
+            return g
+
+        version = self.guild_invalidations.get(guild.id, 0, count=False)
+
         g = await self.Guild.find_one({"id": guild.id})
         if g is None:
             g = self.Guild(id=guild.id)
@@ -616,10 +1326,16 @@ class Mongo(commands.Cog):
                 await g.commit()
             except pymongo.errors.DuplicateKeyError:
                 pass
+
+        if self.guild_invalidations.get(guild.id, 0, count=False) == version:
+            self.guild_cache[guild.id] = g
+
         return g
 
     async def update_guild(self, guild: discord.Guild, update):
-        return await self.db.guild.update_one({"_id": guild.id}, update, upsert=True)
+        result = await self.db.guild.update_one({"_id": guild.id}, update, upsert=True)
+        await self.invalidate_guild(guild)
+        return result
 
     async def fetch_channel(self, channel: discord.TextChannel):
         c = await self.Channel.find_one({"id": channel.id})
@@ -631,6 +1347,9 @@ class Mongo(commands.Cog):
     async def update_channel(self, channel: discord.TextChannel, update):
         return await self.db.channel.update_one({"_id": channel.id}, update, upsert=True)
 
+    def cog_unload(self):
+        self._invalidation_task.cancel()
+
 
 def setup(bot: commands.Bot):
     bot.add_cog(Mongo(bot))
@@ -1,5 +1,6 @@
 import asyncio
 import contextlib
+import functools
 import itertools
 import math
 import re
@@ -52,6 +53,7 @@ class Pokemon(commands.Cog):
                 ops = []
 
         await self.bot.mongo.db.pokemon.bulk_write(ops)
+        await self.bot.mongo.invalidate_pokemon_count(ctx.author)
         await ctx.send("Successfully reindexed all your pokémon!")
 
     @commands.command(aliases=("nick",))
@@ -155,7 +157,8 @@ class Pokemon(commands.Cog):
             nicknameall = None
 
         # check pokemon num
-        num = await self.bot.mongo.fetch_pokemon_count(ctx.author, aggregations=aggregations)
+        pokemon = await self.bot.mongo.fetch_pokemon_docs(ctx.author, aggregations)
+        num = len(pokemon)
 
         if num == 0:
             return await ctx.send("Found no pokémon matching this search.")
@@ -185,12 +188,11 @@ class Pokemon(commands.Cog):
         # confirmed, nickname all
         await ctx.send(f"Renaming {num} pokémon, this might take a while...")
 
-        pokemon = self.bot.mongo.fetch_pokemon_list(ctx.author, aggregations)
-
         await self.bot.mongo.db.pokemon.update_many(
-            {"_id": {"$in": [x.id async for x in pokemon]}},
+            {"_id": {"$in": [x["_id"] for x in pokemon]}, "owner_id": ctx.author.id},
             {"$set": {"nickname": nicknameall}},
         )
+        await self.bot.mongo.invalidate_pokemon_count(ctx.author)
 
         if nicknameall is None:
             await ctx.send(f"Removed nickname for {num} pokémon.")
@@ -325,10 +327,11 @@ class Pokemon(commands.Cog):
             return
 
         # Check pokemon and unfavorited pokemon num
-        num = await self.bot.mongo.fetch_pokemon_count(ctx.author, aggregations=aggregations)
+        pokemon = await self.bot.mongo.fetch_pokemon_docs(ctx.author, aggregations, ("favorite",))
+        num = len(pokemon)
 
-        aggregations.append({"$match": {"pokemon.favorite": {"$ne": True}}})
-        unfavnum = await self.bot.mongo.fetch_pokemon_count(ctx.author, aggregations=aggregations)
+        pokemon = [x for x in pokemon if x.get("favorite") is not True]
+        unfavnum = len(pokemon)
 
         if num == 0:
             return await ctx.send("Found no pokémon matching this search.")
@@ -337,9 +340,6 @@ class Pokemon(commands.Cog):
                 f"Found no unfavorited pokémon within this selection.\nTo mass unfavorite a pokemon, please use `{ctx.prefix}unfavoriteall`."
             )
 
-        # Fetch pokemon list
-        pokemon = self.bot.mongo.fetch_pokemon_list(ctx.author, aggregations)
-
         # confirm
         await ctx.send(
             f"Are you sure you want to **favorite** your {unfavnum} pokémon? Type `confirm favorite {unfavnum}` to confirm."
@@ -361,9 +361,10 @@ class Pokemon(commands.Cog):
             return await ctx.send("Time's up. Aborted.")
 
         await self.bot.mongo.db.pokemon.update_many(
-            {"_id": {"$in": [x.id async for x in pokemon]}},
+            {"_id": {"$in": [x["_id"] for x in pokemon]}, "owner_id": ctx.author.id},
             {"$set": {"favorite": True}},
         )
+        await self.bot.mongo.invalidate_pokemon_count(ctx.author)
 
         await ctx.send(
             f"Favorited your {unfavnum} unfavorited pokemon.\nAll {num} selected pokemon are now favorited."
@@ -422,19 +423,17 @@ class Pokemon(commands.Cog):
             return
 
         # Check pokemon and unfavorited pokemon num
-        num = await self.bot.mongo.fetch_pokemon_count(ctx.author, aggregations=aggregations)
+        pokemon = await self.bot.mongo.fetch_pokemon_docs(ctx.author, aggregations, ("favorite",))
+        num = len(pokemon)
 
-        aggregations.append({"$match": {"pokemon.favorite": True}})
-        favnum = await self.bot.mongo.fetch_pokemon_count(ctx.author, aggregations=aggregations)
+        pokemon = [x for x in pokemon if x.get("favorite") is True]
+        favnum = len(pokemon)
 
         if num == 0:
             return await ctx.send("Found no pokémon matching this search.")
         elif favnum == 0:
             return await ctx.send("Found no favorited pokémon within this selection.")
 
-        # Fetch pokemon list
-        pokemon = self.bot.mongo.fetch_pokemon_list(ctx.author, aggregations)
-
         # confirm
         await ctx.send(
             f"Are you sure you want to **unfavorite** your {favnum} pokémon? Type `confirm unfavorite {favnum}` to confirm."
@@ -456,9 +455,10 @@ class Pokemon(commands.Cog):
             return await ctx.send("Time's up. Aborted.")
 
         await self.bot.mongo.db.pokemon.update_many(
-            {"_id": {"$in": [x.id async for x in pokemon]}},
+            {"_id": {"$in": [x["_id"] for x in pokemon]}, "owner_id": ctx.author.id},
             {"$set": {"favorite": False}},
         )
+        await self.bot.mongo.invalidate_pokemon_count(ctx.author)
 
         await ctx.send(
             f"Unfavorited your {favnum} favorited pokemon.\nAll {num} selected pokemon are now unfavorited."
@@ -787,6 +787,7 @@ class Pokemon(commands.Cog):
         result = await self.bot.mongo.db.pokemon.update_many(
             {"_id": {"$in": list(ids)}, "owner_id": {"$ne": None}}, {"$set": {"owner_id": None}}
         )
+        await self.bot.mongo.invalidate_pokemon_count(ctx.author)
         await self.bot.mongo.update_member(
             ctx.author,
             {
@@ -856,7 +857,8 @@ class Pokemon(commands.Cog):
             ]
         )
 
-        num = await self.bot.mongo.fetch_pokemon_count(ctx.author, aggregations=aggregations)
+        pokemon = await self.bot.mongo.fetch_pokemon_docs(ctx.author, aggregations)
+        num = len(pokemon)
 
         if num == 0:
             return await ctx.send(
@@ -883,16 +885,21 @@ class Pokemon(commands.Cog):
 
         # confirmed, release all
 
-        num = await self.bot.mongo.fetch_pokemon_count(ctx.author, aggregations=aggregations)
-
         await ctx.send(f"Releasing {num} pokémon, this might take a while...")
 
-        pokemon = self.bot.mongo.fetch_pokemon_list(ctx.author, aggregations)
+        # Re-check selected and favorited pokémon, as they may have changed while confirming
+
+        member = await self.bot.mongo.fetch_member_info(ctx.author)
 
         result = await self.bot.mongo.db.pokemon.update_many(
-            {"_id": {"$in": [x.id async for x in pokemon]}, "owner_id": {"$ne": None}},
+            {
+                "_id": {"$in": [x["_id"] for x in pokemon], "$ne": member.selected_id},
+                "owner_id": ctx.author.id,
+                "favorite": {"$ne": True},
+            },
             {"$set": {"owner_id": None}},
         )
+        await self.bot.mongo.invalidate_pokemon_count(ctx.author)
 
         await self.bot.mongo.update_member(
             ctx.author,
@@ -967,17 +974,14 @@ class Pokemon(commands.Cog):
         def format_item(menu, p):
             return f"`{padn(p, menu.maxn)}`　**{p:nif}**　•　Lvl. {p.level}　•　{p.iv_total / 186:.2%}"
 
-        count = await self.bot.mongo.fetch_pokemon_count(ctx.author, aggregations)
-        pokemon = self.bot.mongo.fetch_pokemon_list(ctx.author, aggregations)
-
         pages = pagination.ContinuablePages(
-            pagination.AsyncListPageSource(
-                pokemon,
+            pagination.SeekPageSource(
+                functools.partial(self.bot.mongo.fetch_pokemon_bounds, ctx.author, aggregations),
+                functools.partial(self.bot.mongo.fetch_pokemon_seek, ctx.author, aggregations),
                 title="Your pokémon",
                 prepare_page=prepare_page,
                 format_item=format_item,
                 per_page=20,
-                count=count,
             )
         )
         pages.current_page = flags["page"] - 1
@@ -1022,25 +1026,21 @@ class Pokemon(commands.Cog):
             if pgstart >= 809 or pgstart < 0:
                 return await ctx.send("There are no pokémon on this page.")
 
-            num = await self.bot.mongo.fetch_pokedex_count(ctx.author)
-
             do_emojis = (
                 ctx.guild is None or ctx.guild.me.permissions_in(ctx.channel).external_emojis
             )
 
-            member = await self.bot.mongo.fetch_pokedex(ctx.author, 0, 810)
-            pokedex = member.pokedex
+            member_pokedex = await self.bot.mongo.fetch_pokedex(ctx.author)
+            num = member_pokedex.num_caught()
 
-            if not flags["uncaught"] and not flags["caught"]:
-                for i in range(1, 810):
-                    if str(i) not in pokedex:
-                        pokedex[str(i)] = 0
+            if flags["caught"]:
+                pokedex = {k: v for k, v in member_pokedex.items() if member_pokedex.is_caught(k)}
             elif flags["uncaught"]:
-                for i in range(1, 810):
-                    if str(i) not in pokedex:
-                        pokedex[str(i)] = 0
-                    else:
-                        del pokedex[str(i)]
+                pokedex = {
+                    k: 0 for k, v in member_pokedex.items() if not member_pokedex.is_caught(k)
+                }
+            else:
+                pokedex = dict(member_pokedex.items())
 
             def include(key):
                 if flags["legendary"] and key not in self.bot.data.list_legendary:
@@ -1055,7 +1055,7 @@ class Pokemon(commands.Cog):
 
                 return True
 
-            pokedex = {int(k): v for k, v in pokedex.items() if include(int(k))}
+            pokedex = {k: v for k, v in pokedex.items() if include(k)}
 
             if flags["ordera"]:
                 pokedex = sorted(pokedex.items(), key=itemgetter(1))
@@ -1130,9 +1130,7 @@ class Pokemon(commands.Cog):
                 if species is None:
                     return await ctx.send(f"Could not find a pokemon matching `{search_or_page}`.")
 
-            member = await self.bot.mongo.fetch_pokedex(
-                ctx.author, species.dex_number, species.dex_number + 1
-            )
+            pokedex = await self.bot.mongo.fetch_pokedex(ctx.author)
 
             embed = self.bot.Embed(color=0xFE9AC9)
             embed.title = f"#{species.dex_number} — {species}"
@@ -1190,8 +1188,8 @@ class Pokemon(commands.Cog):
             embed.add_field(name="Types", value="\n".join(species.types))
 
             text = "You haven't caught this pokémon yet!"
-            if str(species.dex_number) in member.pokedex:
-                text = f"You've caught {member.pokedex[str(species.dex_number)]} of this pokémon!"
+            if pokedex.is_caught(species.dex_number):
+                text = f"You've caught {pokedex[species.dex_number]} of this pokémon!"
 
             embed.set_footer(text=text)
 
@@ -1,6 +1,8 @@
 import aioredis
 from discord.ext import commands
 
+POOL_OPTIONS = ("minsize", "maxsize", "pool_cls")
+
 
 class Redis(commands.Cog):
     """For redis."""
@@ -22,6 +24,13 @@ class Redis(commands.Cog):
     async def wait_until_ready(self):
         await self._connect_task
 
+    async def create_connection(self):
+        """Opens a connection outside of the pool, for blocking commands that would
+        otherwise hold a pooled connection while they wait."""
+
+        conf = {k: v for k, v in self.bot.config.REDIS_CONF.items() if k not in POOL_OPTIONS}
+        return await aioredis.create_redis(**conf)
+
     def cog_unload(self):
         self.bot.loop.create_task(self.close())
 
@@ -71,6 +71,7 @@ class Shop(commands.Cog):
                 "$set": {"spawns_remaining": 0},
             },
         )
+        await self.bot.get_cog("Spawning").unschedule_incense(ctx.channel)
         await ctx.send("Incense has been stopped.")
 
     @checks.has_started()
@@ -215,6 +216,12 @@ class Shop(commands.Cog):
 
         text = []
 
+        # Reserve every idx up front instead of once per pokémon
+
+        num_pokemon = sum(1 for reward in rewards if reward["type"] == "pokemon")
+        if num_pokemon > 0:
+            idx = await self.bot.mongo.fetch_next_idx(ctx.author, reserve=num_pokemon)
+
         for reward in rewards:
             if reward["type"] == "pp":
                 update["$inc"]["balance"] += reward["value"]
@@ -265,8 +272,9 @@ class Shop(commands.Cog):
                     "iv_spd": ivs[5],
                     "iv_total": sum(ivs),
                     "shiny": shiny,
-                    "idx": await self.bot.mongo.fetch_next_idx(ctx.author),
+                    "idx": idx,
                 }
+                idx += 1
 
                 text.append(
                     f"{self.bot.mongo.Pokemon.build_from_mongo(pokemon):lni} ({sum(ivs) / 186:.2%} IV)"
@@ -727,6 +735,7 @@ class Shop(commands.Cog):
                     "$inc": {"spawns_remaining": 180},
                 },
             )
+            await self.bot.get_cog("Spawning").schedule_incense(ctx.channel)
 
         if "evolve" in item.action:
             embed = self.bot.Embed(color=0xFE9AC9)
@@ -760,6 +769,7 @@ class Shop(commands.Cog):
 
         if item.action == "level":
             update = {"$set": {"xp": 0}, "$inc": {"level": qty}}
+            self.bot.get_cog("Spawning").xp.take(pokemon.id)
 
             # TODO this code is repeated too many times.
 
@@ -780,8 +790,7 @@ class Shop(commands.Cog):
 
             pokemon.level += qty
             guild = await self.bot.mongo.fetch_guild(ctx.guild)
-            if pokemon.get_next_evolution(guild.is_day) is not None:
-                evo = pokemon.get_next_evolution(guild.is_day)
+            if (evo := pokemon.get_next_evolution(guild.is_day)) is not None:
                 embed.add_field(
                     name=f"Your {name} is evolving!",
                     value=f"Your {name} has turned into a {evo}!",
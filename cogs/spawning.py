@@ -3,17 +3,40 @@ import asyncio
 import io
 import random
 import time
-from collections import defaultdict
 
 import aiohttp
 import discord
 from data import models
 from discord.ext import commands, tasks
+from pymongo import ReturnDocument, UpdateOne
 
-from helpers import checks
+from helpers import checks, pokedex, wild
+from helpers.cache import ExpiringDict, LRUCache
+from helpers.utils import LatencyRecorder
 from . import mongo
 
 MIN_SPAWN_THRESHOLD = 20
+GUILD_SPAWN_RATE = 1 / 30
+GUILD_SPAWN_BURST = 5
+CLUSTER_SPAWN_RATE = 10
+CLUSTER_SPAWN_BURST = 50
+XP_FLUSH_INTERVAL = 10
+INCENSE_INTERVAL = 20
+SPAWN_QUEUE_TIMEOUT = 5
+SPAWN_QUEUE_BATCH = 50
+SPAWN_CONCURRENCY = 25
+SPAWN_QUEUE_SIZE = 500
+IMAGE_CACHE_SIZE = 512
+IMAGE_CACHE_BYTES = 64 * 1024 * 1024
+IMAGE_TIMEOUT = 5
+IMAGE_URL_TTL = 60
+COOLDOWN_TTL = 60
+ACTIVITY_TTL = 3600
+
+
+def read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
 
 
 def write_fp(data):
@@ -23,56 +46,336 @@ def write_fp(data):
     return arr
 
 
+class XPAccumulator:
+    """Collects XP gains in memory and writes them to the database in batches."""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.lock = asyncio.Lock()
+
+        self.pending = {}
+        self.flushing = {}
+        self.pending_increments = 0
+
+        # Counters
+
+        self.increments = 0
+        self.writes = 0
+        self.flushes = 0
+        self.last_flush = time.time()
+        self.last_interval = 0
+        self.last_batch_size = 0
+
+    def add(self, pokemon_id, amount):
+        self.pending[pokemon_id] = self.pending.get(pokemon_id, 0) + amount
+        self.pending_increments += 1
+
+    def get(self, pokemon_id):
+        return self.pending.get(pokemon_id, 0) + self.flushing.get(pokemon_id, 0)
+
+    def take(self, pokemon_id):
+        return self.pending.pop(pokemon_id, 0)
+
+    async def flush(self):
+        async with self.lock:
+            if len(self.pending) == 0:
+                return
+
+            self.flushing, self.pending = self.pending, {}
+            increments, self.pending_increments = self.pending_increments, 0
+
+            try:
+                await self.bot.mongo.db.pokemon.bulk_write(
+                    [UpdateOne({"_id": k}, {"$inc": {"xp": v}}) for k, v in self.flushing.items()],
+                    ordered=False,
+                )
+            except Exception:
+                # Put everything back so the next flush can retry it
+
+                for k, v in self.flushing.items():
+                    self.add(k, v)
+                self.pending_increments += increments - len(self.flushing)
+                raise
+            finally:
+                batch_size = len(self.flushing)
+                self.flushing = {}
+
+            now = time.time()
+            self.increments += increments
+            self.writes += batch_size
+            self.flushes += 1
+            self.last_interval = now - self.last_flush
+            self.last_flush = now
+            self.last_batch_size = batch_size
+
+    @property
+    def coalescing_ratio(self):
+        if self.writes == 0:
+            return 0
+        return self.increments / self.writes
+
+    def stats(self):
+        return {
+            "pending": len(self.pending),
+            "flushes": self.flushes,
+            "last_interval": self.last_interval,
+            "last_batch_size": self.last_batch_size,
+            "increments": self.increments,
+            "writes": self.writes,
+            "coalescing_ratio": self.coalescing_ratio,
+        }
+
+
+class SpawnController:
+    """Decides whether a guild that has reached its message threshold gets a spawn. Each
+    guild has its own token bucket, so busy guilds are slowed down without affecting the
+    rest, and every spawn on the cluster also takes a token from a shared bucket."""
+
+    def __init__(self):
+        # Guild id -> [tokens, last refill, spawns, first seen]
+
+        self.guilds = ExpiringDict(ttl=ACTIVITY_TTL)
+        self.tokens = CLUSTER_SPAWN_BURST
+        self.updated = time.monotonic()
+        self.denied = 0
+
+    def acquire(self, guild_id):
+        now = time.monotonic()
+
+        refill = (now - self.updated) * CLUSTER_SPAWN_RATE
+        self.tokens = min(CLUSTER_SPAWN_BURST, self.tokens + refill)
+        self.updated = now
+
+        bucket = self.guilds.get(guild_id)
+        if bucket is None:
+            bucket = self.guilds[guild_id] = [GUILD_SPAWN_BURST, now, 0, now]
+        else:
+            bucket[0] = min(GUILD_SPAWN_BURST, bucket[0] + (now - bucket[1]) * GUILD_SPAWN_RATE)
+            bucket[1] = now
+
+        if bucket[0] < 1 or self.tokens < 1:
+            self.denied += 1
+            return False
+
+        bucket[0] -= 1
+        bucket[2] += 1
+        self.tokens -= 1
+        return True
+
+    def rates(self):
+        """Returns the spawns per hour of each guild since it was first seen."""
+
+        now = time.monotonic()
+        return {k: v[2] * 3600 / max(now - v[3], 1) for k, v in self.guilds.items()}
+
+    def stats(self):
+        return {"tokens": self.tokens, "guilds": len(self.guilds), "denied": self.denied}
+
+
 class Spawning(commands.Cog):
     """For basic bot operation."""
 
     def __init__(self, bot):
         self.bot = bot
-        self.spawn_threshold = MIN_SPAWN_THRESHOLD * 2
+        self.spawn_controller = SpawnController()
 
-        self.caught_users = defaultdict(list)
-        self.bot.cooldown_users = {}
-        self.bot.cooldown_guilds = {}
+        # Cooldowns only matter for a few seconds after a message, so idle users and guilds
+        # are forgotten instead of being kept forever
+
+        self.bot.cooldown_users = ExpiringDict(ttl=COOLDOWN_TTL)
+        self.bot.cooldown_guilds = ExpiringDict(ttl=COOLDOWN_TTL)
+
+        self.xp = XPAccumulator(bot)
+        self.catch_latency = LatencyRecorder()
+        self.spawn_latency = LatencyRecorder()
+        self.spawn_slots = asyncio.Semaphore(SPAWN_CONCURRENCY)
+        self.spawns_in_flight = 0
+
+        # Spawn images by (species id, time of day), or (species id, None) for the
+        # fallback files, so that repeated species don't go back to the image server. It's
+        # bounded by the total size of the images as well, since some of them are large.
+
+        self.http = None
+        self.images = LRUCache(maxsize=IMAGE_CACHE_SIZE, maxbytes=IMAGE_CACHE_BYTES)
+        self.image_latency = LatencyRecorder()
+
+        # CDN URLs of uploaded spawn images that were recently checked to still exist. The
+        # check is repeated in the background every minute, since the upload goes away
+        # with its message.
+
+        self.checked_image_urls = LRUCache(maxsize=IMAGE_CACHE_SIZE, ttl=IMAGE_URL_TTL)
 
         self.spawn_incense.start()
-        self.send_spawns.start()
+        self.flush_xp.start()
+        self._spawn_task = self.bot.loop.create_task(self.consume_spawns())
+
+        # Message counts towards the next spawn survive reloads, but are dropped for guilds
+        # that have been quiet for an hour
+
+        counter = ExpiringDict(ttl=ACTIVITY_TTL)
+        for k, v in getattr(self.bot, "guild_counter", {}).items():
+            counter[k] = v
+        self.bot.guild_counter = counter
 
-        if not hasattr(self.bot, "guild_counter"):
-            self.bot.guild_counter = {}
+    @property
+    def queue_key(self):
+        return f"queue:{self.bot.cluster_idx}"
 
-    @tasks.loop(seconds=0.25)
-    async def send_spawns(self):
+    async def queue_spawn(self, channel):
+        # If the backlog grows past its limit, the oldest spawns are dropped
+
+        pipe = self.bot.redis.pipeline()
+        pipe.rpush(self.queue_key, f"{channel.id}:{time.time()}")
+        pipe.ltrim(self.queue_key, -SPAWN_QUEUE_SIZE, -1)
+        await pipe.execute()
+
+    async def consume_spawns(self):
         await self.bot.get_cog("Redis").wait_until_ready()
         await self.bot.wait_until_ready()
 
-        channel = await self.bot.redis.lpop(f"queue:{self.bot.cluster_idx}")
-        if channel is None:
-            self.spawn_threshold = MIN_SPAWN_THRESHOLD
+        while True:
+            conn = None
+            try:
+                # BLPOP holds its connection while it waits, so it gets one of its own
+
+                conn = await self.bot.get_cog("Redis").create_connection()
+                while True:
+                    item = await conn.blpop(self.queue_key, timeout=SPAWN_QUEUE_TIMEOUT)
+                    if item is None:
+                        continue
+
+                    tr = conn.multi_exec()
+                    tr.lrange(self.queue_key, 0, SPAWN_QUEUE_BATCH - 2)
+                    tr.ltrim(self.queue_key, SPAWN_QUEUE_BATCH - 1, -1)
+                    rest, _ = await tr.execute()
+
+                    for entry in [item[1], *rest]:
+                        channel_id, _, queued_at = entry.decode().partition(":")
+                        channel = self.bot.get_channel(int(channel_id))
+                        if channel is None:
+                            continue
+
+                        # Wait for a free slot, so that a backlog stays in the queue
+                        # instead of piling up as tasks
+
+                        await self.spawn_slots.acquire()
+                        self.bot.loop.create_task(
+                            self.run_queued_spawn(channel, float(queued_at or time.time()))
+                        )
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self.bot.log.exception("Spawn queue consumer failed, reconnecting")
+            finally:
+                if conn is not None:
+                    conn.close()
+
+            await asyncio.sleep(1)
+
+    async def run_queued_spawn(self, channel, queued_at):
+        self.spawns_in_flight += 1
+        try:
+            self.spawn_latency.record("queue", time.time() - queued_at)
+            with self.spawn_latency.measure("spawn"):
+                await self.spawn_pokemon(channel)
+        finally:
+            self.spawns_in_flight -= 1
+            self.spawn_slots.release()
+
+    def activity_stats(self):
+        return {
+            "cooldown_users": self.bot.cooldown_users.stats(),
+            "cooldown_guilds": self.bot.cooldown_guilds.stats(),
+            "guild_counter": self.bot.guild_counter.stats(),
+        }
+
+    async def spawn_stats(self):
+        return {
+            "depth": await self.bot.redis.llen(self.queue_key),
+            "in_flight": self.spawns_in_flight,
+            "controller": self.spawn_controller.stats(),
+            "rates": self.spawn_controller.rates(),
+            "latency": self.spawn_latency.stats(),
+        }
+
+    @property
+    def incense_key(self):
+        return f"incense:{self.bot.cluster_idx}"
+
+    async def schedule_incense(self, *channels, delay=0):
+        """Schedules the next incense spawn in channels on this cluster."""
+
+        if len(channels) == 0:
             return
 
-        channel = self.bot.get_channel(int(channel))
-        if channel is None:
+        at = time.time() + delay
+        pairs = [x for c in channels for x in (at, getattr(c, "id", c))]
+        await self.bot.redis.zadd(self.incense_key, *pairs)
+
+    async def unschedule_incense(self, *channels):
+        if len(channels) == 0:
             return
 
-        self.bot.loop.create_task(self.spawn_pokemon(channel))
+        await self.bot.redis.zrem(self.incense_key, *(getattr(c, "id", c) for c in channels))
+
+    async def load_incenses(self):
+        """Schedules the active incenses in channels on this cluster. Incenses are scheduled
+        when they are bought, so this only has to catch up after a restart."""
 
-    @tasks.loop(seconds=20)
+        channels = self.bot.mongo.db.channel.find({"spawns_remaining": {"$gt": 0}}, {"_id": 1})
+        ids = [x["_id"] async for x in channels if self.bot.get_channel(x["_id"]) is not None]
+        await self.schedule_incense(*ids)
+
+    @tasks.loop(seconds=1)
     async def spawn_incense(self):
         if not self.bot.enabled:
             return
 
-        channels = self.bot.mongo.db.channel.find({"spawns_remaining": {"$gt": 0}})
-        async for result in channels:
-            channel = self.bot.get_channel(result["_id"])
+        # Channels are kept in a sorted set by the time of their next spawn, so each
+        # cluster only reads and updates the incenses in its own channels.
+
+        due = await self.bot.redis.zrangebyscore(self.incense_key, max=time.time())
+        if len(due) == 0:
+            return
+
+        ids = [int(x) for x in due]
+        active = {
+            x["_id"]: x["spawns_remaining"]
+            async for x in self.bot.mongo.db.channel.find(
+                {"_id": {"$in": ids}, "spawns_remaining": {"$gt": 0}}
+            )
+        }
+
+        spawned = []
+        for channel_id, remaining in active.items():
+            channel = self.bot.get_channel(channel_id)
             if channel is not None:
-                self.bot.loop.create_task(
-                    self.spawn_pokemon(channel, incense=result["spawns_remaining"])
-                )
-                await self.bot.mongo.update_channel(channel, {"$inc": {"spawns_remaining": -1}})
+                self.bot.loop.create_task(self.spawn_pokemon(channel, incense=remaining))
+                spawned.append(channel_id)
+
+        if len(spawned) > 0:
+            await self.bot.mongo.db.channel.update_many(
+                {"_id": {"$in": spawned}}, {"$inc": {"spawns_remaining": -1}}
+            )
+
+        await self.schedule_incense(*(x for x in spawned if active[x] > 1), delay=INCENSE_INTERVAL)
+        await self.unschedule_incense(*(x for x in ids if x not in spawned or active[x] <= 1))
 
     @spawn_incense.before_loop
     async def before_spawn_incense(self):
+        await self.bot.get_cog("Redis").wait_until_ready()
         await self.bot.wait_until_ready()
+        await self.load_incenses()
+
+    async def try_flush_xp(self):
+        try:
+            await self.xp.flush()
+        except Exception:
+            self.bot.log.exception("Failed to flush XP")
+
+    @tasks.loop(seconds=XP_FLUSH_INTERVAL)
+    async def flush_xp(self):
+        await self.try_flush_xp()
 
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
@@ -81,9 +384,7 @@ class Spawning(commands.Cog):
         if not self.bot.enabled or message.author.bot or message.guild is None:
             return
 
-        ctx = await self.bot.get_context(message)
-
-        if ctx.valid:
+        if await self.bot.get_command_context(message) is not None:
             return
 
         current = time.time()
@@ -108,16 +409,31 @@ class Spawning(commands.Cog):
 
                 # TODO this stuff here needs to be refactored
 
+                pokemon.xp += self.xp.get(pokemon.id)
+
                 if pokemon.level < 100 and pokemon.xp < pokemon.max_xp:
                     xp_inc = random.randint(10, 40)
 
                     if member.boost_active or message.guild.id == 716390832034414685:
                         xp_inc *= 2
-                    pokemon.xp += xp_inc
 
-                    await self.bot.mongo.update_pokemon(pokemon, {"$inc": {"xp": xp_inc}})
+                    if pokemon.xp + xp_inc < pokemon.max_xp:
+                        self.xp.add(pokemon.id, xp_inc)
+                        pokemon.xp += xp_inc
+                    else:
+                        # About to level up, so write through and trust the stored value
+
+                        result = await self.bot.mongo.db.pokemon.find_one_and_update(
+                            {"_id": pokemon.id},
+                            {"$inc": {"xp": xp_inc + self.xp.take(pokemon.id)}},
+                            projection={"xp": 1},
+                            return_document=ReturnDocument.AFTER,
+                        )
+                        if result is not None:
+                            pokemon.xp = result["xp"]
 
                 if pokemon.xp >= pokemon.max_xp and pokemon.level < 100:
+                    self.xp.take(pokemon.id)
                     update = {"$set": {f"xp": 0, f"level": pokemon.level + 1}}
                     embed = self.bot.Embed(color=0xFE9AC9)
                     embed.title = f"Congratulations {message.author.display_name}!"
@@ -136,8 +452,7 @@ class Spawning(commands.Cog):
 
                     pokemon.level += 1
                     guild = await self.bot.mongo.fetch_guild(message.channel.guild)
-                    if pokemon.get_next_evolution(guild.is_day) is not None:
-                        evo = pokemon.get_next_evolution(guild.is_day)
+                    if (evo := pokemon.get_next_evolution(guild.is_day)) is not None:
                         embed.add_field(
                             name=f"Your {name} is evolving!",
                             value=f"Your {name} has turned into a {evo}!",
@@ -194,11 +509,13 @@ class Spawning(commands.Cog):
             return
 
         self.bot.cooldown_guilds[message.guild.id] = current
-        self.bot.guild_counter[message.guild.id] = (
-            self.bot.guild_counter.get(message.guild.id, 0) + 1
-        )
+        count = self.bot.guild_counter.get(message.guild.id, 0) + 1
+        self.bot.guild_counter[message.guild.id] = count
+
+        # A guild that is out of tokens keeps its count, so it spawns on the first
+        # message after it gets one back
 
-        if self.bot.guild_counter[message.guild.id] >= self.spawn_threshold:
+        if count >= MIN_SPAWN_THRESHOLD and self.spawn_controller.acquire(message.guild.id):
             self.bot.guild_counter[message.guild.id] = 0
 
             guild = await self.bot.mongo.fetch_guild(message.guild)
@@ -227,75 +544,194 @@ class Spawning(commands.Cog):
                     )
                 ]
 
-                await self.bot.redis.rpush(f"queue:{self.bot.cluster_idx}", channel2.id)
+                await self.queue_spawn(channel2)
+
+            await self.queue_spawn(channel)
+
+    def get_http(self):
+        if self.http is None:
+            self.http = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=IMAGE_TIMEOUT))
+        return self.http
+
+    async def check_image_url(self, species, time_of_day, url):
+        """Checks that the CDN URL of a previous upload of a spawn image still exists, and
+        removes it from the shared spawn_images hash if it doesn't. The URL counts as
+        checked while this runs, so that concurrent spawns don't check it again."""
+
+        self.checked_image_urls[url] = True
+
+        try:
+            async with self.get_http().head(url) as resp:
+                ok = resp.status == 200
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            self.checked_image_urls.pop(url)
+            return
+
+        try:
+            if not ok:
+                await self.forget_image_url(species, time_of_day, url)
+        except Exception:
+            self.bot.log.exception(f"Couldn't forget spawn image {url}")
+
+    async def forget_image_url(self, species, time_of_day, url):
+        self.checked_image_urls.pop(url)
+        await self.bot.redis.hdel("spawn_images", f"{species.id}:{time_of_day}")
+
+    async def register_image_url(self, species, time_of_day, message):
+        if len(message.embeds) == 0 or not message.embeds[0].image:
+            return
+
+        url = message.embeds[0].image.url
+        if url.startswith("https://"):
+            await self.bot.redis.hset("spawn_images", f"{species.id}:{time_of_day}", url)
+            self.checked_image_urls[url] = True
+
+    async def fetch_spawn_image(self, species, time_of_day):
+        """Returns the bytes and filename of the image of a wild pokémon, rendered by the
+        image server if possible and read from the bundled files otherwise."""
+
+        if hasattr(self.bot.config, "SERVER_URL"):
+            key = (species.id, time_of_day)
+            if (data := self.images.get(key)) is not None:
+                return data, "pokemon.jpg"
+
+            url = urljoin(self.bot.config.SERVER_URL, f"image?species={species.id}&time=")
+            url += time_of_day
+
+            try:
+                with self.image_latency.measure("server"):
+                    async with self.get_http().get(url) as resp:
+                        if resp.status == 200:
+                            data = await resp.read()
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                self.bot.log.exception(f"Couldn't fetch spawn image {url}")
+
+            if data is not None:
+                self.images[key] = data
+                return data, "pokemon.jpg"
+
+        key = (species.id, None)
+        if (data := self.images.get(key)) is None:
+            with self.image_latency.measure("file"):
+                data = await self.bot.loop.run_in_executor(
+                    None, read_file, f"data/images/{species.id}.png"
+                )
+            self.images[key] = data
+
+        return data, "pokemon.png"
+
+    def image_stats(self):
+        stats = self.images.stats()
+        latency = self.image_latency.stats()
+        server = latency.get("server", {"mean_ms": 0})
+        stats["saved_ms"] = self.images.hits * server["mean_ms"]
+        stats["latency"] = latency
+        return stats
+
+    async def fetch_spawn_state(self, channel, species):
+        """Returns the wild pokémon in a channel and the CDN URLs of the day and night
+        images of a species, in one round trip."""
+
+        pipe = self.bot.redis.pipeline()
+        pipe.get(f"wild:{channel.id}")
+        pipe.hmget("spawn_images", f"{species.id}:day", f"{species.id}:night", encoding="utf-8")
+        prev, (day, night) = await pipe.execute()
+
+        if prev is not None:
+            prev = wild.Wild.decode(prev)
+        return prev, {"day": day, "night": night}
 
-            await self.bot.redis.rpush(f"queue:{self.bot.cluster_idx}", channel.id)
+    async def fetch_spawn_media(self, species, time_of_day, url):
+        """Returns a CDN URL to link the image from, or the image to upload. URLs that
+        weren't checked recently are still linked, and checked in the background."""
 
-            self.spawn_threshold *= 1.1
+        if url is not None:
+            if url not in self.checked_image_urls:
+                self.bot.loop.create_task(self.check_image_url(species, time_of_day, url))
+            return url, None
+        return None, await self.fetch_spawn_image(species, time_of_day)
 
     async def spawn_pokemon(self, channel, species=None, incense=None, redeem=False):
-        prev_species = None
-        if await self.bot.redis.hexists("wild", channel.id):
-            prev_species_id = await self.bot.redis.hget("wild", channel.id)
-            prev_species = self.bot.data.species_by_number(int(prev_species_id))
+        permissions = channel.permissions_for(channel.guild.me)
+        if not (permissions.send_messages and permissions.attach_files and permissions.embed_links):
+            return False
 
         if species is None:
             species = self.bot.data.random_spawn()
 
-        if not redeem and await self.bot.redis.get(f"redeem:{channel.id}"):
+        # Independent lookups are started together, so that a spawn waits for the slowest
+        # of them rather than for all of them in turn
+
+        guild, (prev, urls) = await asyncio.gather(
+            self.bot.mongo.fetch_guild(channel.guild),
+            self.fetch_spawn_state(channel, species),
+        )
+
+        if not redeem and prev is not None and prev.redeemed:
             return
 
         self.bot.log.info(f"POKEMON {channel.id} {species.id} {species}")
 
-        permissions = channel.permissions_for(channel.guild.me)
-        if not (permissions.send_messages and permissions.attach_files and permissions.embed_links):
-            return False
+        # Images are uploaded once and linked from the CDN afterwards. Only images from the
+        # image server are registered, so the fallback files are replaced once it's back.
 
-        # spawn
+        time_of_day = "day" if guild.is_day else "night"
+        prefix, (url, fetched) = await asyncio.gather(
+            self.bot.get_cog("Bot").determine_prefix(channel.guild),
+            self.fetch_spawn_media(species, time_of_day, urls[time_of_day]),
+        )
 
-        guild = await self.bot.mongo.fetch_guild(channel.guild)
+        # spawn
 
         embed = self.bot.Embed(color=0xFE9AC9)
-        if prev_species:
+        if prev is not None:
+            prev_species = self.bot.data.species_by_number(prev.species_id)
             embed.title = f"Wild {prev_species} fled. A new wild pokémon has appeared!"
         else:
             embed.title = "A wild pokémon has appeared!"
 
-        prefix = await self.bot.get_cog("Bot").determine_prefix(channel.guild)
         prefix = prefix[0]
         embed.description = f"Guess the pokémon and type `{prefix}catch <pokémon>` to catch it!"
 
         image = None
 
-        if hasattr(self.bot.config, "SERVER_URL"):
-            async with aiohttp.ClientSession() as session:
-                url = urljoin(self.bot.config.SERVER_URL, f"image?species={species.id}&time=")
-                url += "day" if guild.is_day else "night"
-                async with session.get(url) as resp:
-                    if resp.status == 200:
-                        arr = await self.bot.loop.run_in_executor(None, write_fp, await resp.read())
-                        image = discord.File(arr, filename="pokemon.jpg")
-                        embed.set_image(url="attachment://pokemon.jpg")
-
-        if image is None:
-            image = discord.File(f"data/images/{species.id}.png", filename="pokemon.png")
-            embed.set_image(url="attachment://pokemon.png")
+        if url is not None:
+            embed.set_image(url=url)
+        else:
+            data, filename = fetched
+            image = discord.File(write_fp(data), filename=filename)
+            embed.set_image(url=f"attachment://{filename}")
 
         if incense:
             embed.set_footer(text=f"Incense: Active.\nSpawns Remaining: {incense-1}.")
 
-        self.caught_users[channel.id] = set()
-        await self.bot.redis.hset("wild", channel.id, species.id)
-
-        if redeem:
-            await self.bot.redis.set(f"redeem:{channel.id}", 1)
-            await self.bot.redis.expire(f"redeem:{channel.id}", 30)
+        await wild.spawn(
+            self.bot.redis, channel.id, species.id, species.correct_guesses, redeem=redeem
+        )
 
-        await channel.send(
+        message = await channel.send(
             file=image,
             embed=embed,
         )
 
+        # Discord accepts embeds linking an upload that was deleted and leaves the image
+        # blank, so the URL is forgotten and the spawn is sent again with the image uploaded
+
+        if url is not None and not (message.embeds and message.embeds[0].image.width):
+            await self.forget_image_url(species, time_of_day, url)
+            try:
+                await message.delete()
+            except discord.HTTPException:
+                pass
+
+            data, filename = await self.fetch_spawn_image(species, time_of_day)
+            image = discord.File(write_fp(data), filename=filename)
+            embed.set_image(url=f"attachment://{filename}")
+            message = await channel.send(file=image, embed=embed)
+
+        if image is not None and image.filename == "pokemon.jpg":
+            await self.register_image_url(species, time_of_day, message)
+
         return True
 
     @checks.has_started()
@@ -305,11 +741,11 @@ class Spawning(commands.Cog):
     async def hint(self, ctx):
         """Get a hint for the wild pokémon."""
 
-        if not await self.bot.redis.hexists("wild", ctx.channel.id):
+        state = await wild.fetch(self.bot.redis, ctx.channel.id)
+        if state is None:
             return
 
-        species_id = await self.bot.redis.hget("wild", ctx.channel.id)
-        species = self.bot.data.species_by_number(int(species_id))
+        species = self.bot.data.species_by_number(state.species_id)
 
         inds = [i for i, x in enumerate(species.name) if x.isalpha()]
         blanks = random.sample(inds, len(inds) // 2)
@@ -321,31 +757,42 @@ class Spawning(commands.Cog):
         await ctx.send(f"The pokémon is {hint}.")
 
     @checks.has_started()
-    @commands.max_concurrency(1, commands.BucketType.channel, wait=True)
     @commands.command(aliases=("c",))
     async def catch(self, ctx, *, guess: str):
         """Catch a wild pokémon."""
 
-        # Retrieve correct species and level from tracker
+        # The guess is checked and the pokémon claimed in one atomic step, so concurrent
+        # catches in a channel don't need to wait for each other
 
-        if not await self.bot.redis.hexists("wild", ctx.channel.id):
-            return
+        keep = ctx.channel.id == 759559123657293835
+
+        with self.catch_latency.measure("claim"):
+            guess = models.deaccent(guess.lower().replace("′", "'"))
+            args = (self.bot.redis, ctx.channel.id, guess, ctx.author.id)
+            result = await wild.claim(*args, keep=keep)
+            if result is None:
+                return
 
-        species_id = await self.bot.redis.hget("wild", ctx.channel.id)
-        species = self.bot.data.species_by_number(int(species_id))
+            outcome, species_id = result
+            species = self.bot.data.species_by_number(species_id)
 
-        if models.deaccent(guess.lower().replace("′", "'")) not in species.correct_guesses:
-            return await ctx.send("That is the wrong pokémon!")
+            # The guesses may be missing if the pokémon spawned before they were stored
+            # with it in redis
 
-        # Correct guess, add to database
+            if outcome == wild.WRONG and guess in species.correct_guesses:
+                result = await wild.claim(*args, keep=keep, species=species)
+                if result is None:
+                    return
+                outcome, species_id = result
+                species = self.bot.data.species_by_number(species_id)
 
-        if ctx.channel.id == 759559123657293835:
-            if ctx.author.id in self.caught_users[ctx.channel.id]:
+            if outcome == wild.WRONG:
+                return await ctx.send("That is the wrong pokémon!")
+
+            if outcome == wild.ALREADY_CAUGHT:
                 return await ctx.send("You have already caught this pokémon!")
 
-            self.caught_users[ctx.channel.id].add(ctx.author.id)
-        else:
-            await self.bot.redis.hdel("wild", ctx.channel.id)
+            # Correct guess, add to database
 
         member = await self.bot.mongo.fetch_member_info(ctx.author)
 
@@ -356,88 +803,70 @@ class Spawning(commands.Cog):
 
         ivs = [mongo.random_iv() for i in range(6)]
 
-        await self.bot.mongo.db.pokemon.insert_one(
-            {
-                "owner_id": ctx.author.id,
-                "species_id": species.id,
-                "level": level,
-                "xp": 0,
-                "nature": mongo.random_nature(),
-                "iv_hp": ivs[0],
-                "iv_atk": ivs[1],
-                "iv_defn": ivs[2],
-                "iv_satk": ivs[3],
-                "iv_sdef": ivs[4],
-                "iv_spd": ivs[5],
-                "iv_total": sum(ivs),
-                "moves": moves[:4],
-                "shiny": shiny,
-                "idx": await self.bot.mongo.fetch_next_idx(ctx.author),
-            }
-        )
-        if shiny:
-            await self.bot.mongo.update_member(ctx.author, {"$inc": {"shinies_caught": 1}})
-
-        message = f"Congratulations {ctx.author.mention}! You caught a level {level} {species}!"
-
-        memberp = await self.bot.mongo.fetch_pokedex(
-            ctx.author, species.dex_number, species.dex_number + 1
-        )
-
-        if str(species.dex_number) not in memberp.pokedex:
-            message += " Added to Pokédex. You received 35 Pokécoins!"
-
-            await self.bot.mongo.update_member(
-                ctx.author,
-                {
-                    "$set": {f"pokedex.{species.dex_number}": 1},
-                    "$inc": {"balance": 35},
+        # Every change to the member happens in one write, which returns the values from
+        # before it to work out the idx, the reward and the streak. The idx comes from the
+        # block held on this cluster if there is one, so that no values are skipped.
+
+        idx = self.bot.mongo.take_block_idx(ctx.author)
+
+        with self.catch_latency.measure("member"):
+            before = await self.bot.mongo.db.member.find_one_and_update(
+                {"_id": ctx.author.id},
+                pokedex.catch_update(species, shiny=shiny, reserve_idx=idx is None),
+                projection={
+                    "next_idx": 1,
+                    f"pokedex.{species.dex_number}": 1,
+                    "shiny_hunt": 1,
+                    "shiny_streak": 1,
                 },
+                return_document=ReturnDocument.BEFORE,
             )
 
-        else:
-            inc_bal = 0
-
-            if memberp.pokedex[str(species.dex_number)] + 1 == 10:
-                message += f" This is your 10th {self.bot.data.species_by_number(species.dex_number)}! You received 350 Pokécoins."
-                inc_bal = 350
-
-            elif memberp.pokedex[str(species.dex_number)] + 1 == 100:
-                message += f" This is your 100th {self.bot.data.species_by_number(species.dex_number)}! You received 3,500 Pokécoins."
-                inc_bal = 3500
+        with self.catch_latency.measure("insert"):
+            await self.bot.mongo.db.pokemon.insert_one(
+                {
+                    "owner_id": ctx.author.id,
+                    "species_id": species.id,
+                    "level": level,
+                    "xp": 0,
+                    "nature": mongo.random_nature(),
+                    "iv_hp": ivs[0],
+                    "iv_atk": ivs[1],
+                    "iv_defn": ivs[2],
+                    "iv_satk": ivs[3],
+                    "iv_sdef": ivs[4],
+                    "iv_spd": ivs[5],
+                    "iv_total": sum(ivs),
+                    "moves": moves[:4],
+                    "shiny": shiny,
+                    "idx": before.get("next_idx", 1) if idx is None else idx,
+                }
+            )
 
-            elif memberp.pokedex[str(species.dex_number)] + 1 == 1000:
-                message += f" This is your 1,000th {self.bot.data.species_by_number(species.dex_number)}! You received 35,000 Pokécoins."
-                inc_bal = 35000
+        with self.catch_latency.measure("redis"):
+            pipe = self.bot.redis.pipeline()
+            await self.bot.mongo.invalidate_pokemon_count(ctx.author, pipe=pipe)
+            await self.bot.mongo.invalidate_member(ctx.author, pipe=pipe)
+            await pipe.execute()
 
-            elif memberp.pokedex[str(species.dex_number)] + 1 == 10000:
-                message += f" This is your 10,000th {self.bot.data.species_by_number(species.dex_number)}! You received 350,000 Pokécoins."
-                inc_bal = 350000
+        message = f"Congratulations {ctx.author.mention}! You caught a level {level} {species}!"
 
-            elif memberp.pokedex[str(species.dex_number)] + 1 == 100000:
-                message += f" This is your 100,000th {self.bot.data.species_by_number(species.dex_number)}! You received 3,500,000 Pokécoins."
-                inc_bal = 3500000
+        count = before.get("pokedex", {}).get(str(species.dex_number), 0) + 1
 
-            await self.bot.mongo.update_member(
-                ctx.author,
-                {
-                    "$inc": {"balance": inc_bal, f"pokedex.{species.dex_number}": 1},
-                },
-            )
+        if count == 1:
+            message += " Added to Pokédex. You received 35 Pokécoins!"
+        elif count in pokedex.CATCH_REWARDS:
+            message += f" This is your {count:,}th {self.bot.data.species_by_number(species.dex_number)}! You received {pokedex.CATCH_REWARDS[count]:,} Pokécoins."
 
-        if member.shiny_hunt == species.dex_number:
+        if before.get("shiny_hunt") == species.dex_number:
             if shiny:
                 message += f"\n\nShiny streak reset."
-                await self.bot.mongo.update_member(ctx.author, {"$set": {"shiny_streak": 0}})
             else:
-                message += f"\n\n+1 Shiny chain! (**{member.shiny_streak + 1}**)"
-                await self.bot.mongo.update_member(ctx.author, {"$inc": {"shiny_streak": 1}})
+                message += f"\n\n+1 Shiny chain! (**{before.get('shiny_streak', 0) + 1}**)"
 
         if shiny:
             message += "\n\nThese colors seem unusual... ✨"
 
-        await self.bot.redis.delete(f"redeem:{ctx.channel.id}")
-
         self.bot.dispatch("catch", ctx.author, species)
         await ctx.send(message)
 
@@ -502,7 +931,11 @@ class Spawning(commands.Cog):
 
     def cog_unload(self):
         self.spawn_incense.cancel()
-        self.send_spawns.cancel()
+        self._spawn_task.cancel()
+        if self.http is not None:
+            self.bot.loop.create_task(self.http.close())
+        self.flush_xp.cancel()
+        self.bot.loop.create_task(self.try_flush_xp())
 
 
 def setup(bot):
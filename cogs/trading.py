@@ -161,6 +161,7 @@ class Trading(commands.Cog):
 
                     num_pokes = len(list(x for x in side if type(x) != int))
                     idx = await self.bot.mongo.fetch_next_idx(omem, num_pokes)
+                    await self.bot.mongo.invalidate_pokemon_count(mem)
 
                     if trade["pokecoins"][i] > 0:
                         await self.bot.mongo.update_member(
@@ -690,7 +691,13 @@ class Trading(commands.Cog):
             ]
         )
 
-        num = await self.bot.mongo.fetch_pokemon_count(ctx.author, aggregations=aggregations)
+        trade_size = len(self.bot.trades[ctx.author.id]["pokemon"][ctx.author.id])
+
+        # Count and fetch in one query, the list is reused once confirmed
+
+        num, pokemon = await self.bot.mongo.fetch_pokemon_page(
+            ctx.author, aggregations, limit=max(3000 - trade_size, 1)
+        )
 
         if num == 0:
             return await ctx.send(
@@ -699,8 +706,6 @@ class Trading(commands.Cog):
 
         # confirm
 
-        trade_size = len(self.bot.trades[ctx.author.id]["pokemon"][ctx.author.id])
-
         if 3000 - trade_size < 0:
             return await ctx.send(
                 f"There are too many pokémon in this trade! Try adding them individually or seperating it into different trades."
@@ -731,12 +736,10 @@ class Trading(commands.Cog):
 
         await ctx.send(f"Adding {num} pokémon, this might take a while...")
 
-        pokemon = self.bot.mongo.fetch_pokemon_list(ctx.author, aggregations)
-
         self.bot.trades[ctx.author.id]["pokemon"][ctx.author.id].extend(
             [
                 x
-                async for x in pokemon
+                for x in pokemon
                 if all(
                     (
                         type(i) == int or x.idx != i.idx
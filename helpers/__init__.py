@@ -1 +1 @@
-from . import checks, constants, converters, pagination
+from . import cache, checks, constants, converters, pagination, pipeline, pokedex, wild
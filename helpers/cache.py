@@ -0,0 +1,184 @@
+import sys
+import time
+from collections import OrderedDict
+
+MISSING = object()
+
+
+class LRUCache:
+    """A bounded mapping that evicts the least recently used entries and,
+    if a ttl is given, entries older than ttl seconds. If maxbytes is given,
+    entries are also evicted once their total size by sizeof exceeds it."""
+
+    def __init__(self, maxsize=1024, ttl=None, *, maxbytes=None, sizeof=len):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.maxbytes = maxbytes
+        self.sizeof = sizeof
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return self.get(key, MISSING, count=False) is not MISSING
+
+    def __getitem__(self, key):
+        value = self.get(key, MISSING)
+        if value is MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def get(self, key, default=None, *, count=True):
+        try:
+            expires, value = self._data[key]
+        except KeyError:
+            if count:
+                self.misses += 1
+            return default
+
+        if expires is not None and expires < time.monotonic():
+            self.pop(key)
+            if count:
+                self.misses += 1
+            return default
+
+        self._data.move_to_end(key)
+        if count:
+            self.hits += 1
+        return value
+
+    def set(self, key, value, ttl=MISSING):
+        if ttl is MISSING:
+            ttl = self.ttl
+
+        self.pop(key)
+        self._data[key] = (None if ttl is None else time.monotonic() + ttl, value)
+        if self.maxbytes is not None:
+            self.nbytes += self.sizeof(value)
+
+        while len(self._data) > self.maxsize or (
+            self.maxbytes is not None and self.nbytes > self.maxbytes and len(self._data) > 1
+        ):
+            self.pop(next(iter(self._data)))
+
+    def pop(self, key, default=None):
+        try:
+            value = self._data.pop(key)[1]
+        except KeyError:
+            return default
+        if self.maxbytes is not None:
+            self.nbytes -= self.sizeof(value)
+        return value
+
+    def clear(self):
+        self._data.clear()
+        self.nbytes = 0
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        if total == 0:
+            return 0
+        return self.hits / total
+
+    def stats(self):
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "bytes": self.nbytes,
+            "maxbytes": self.maxbytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+        }
+
+
+class ExpiringDict:
+    """A mapping that forgets keys that haven't been set or read for a while. Keys are
+    kept in two generations, and every ttl seconds the older one is dropped and the newer
+    one takes its place. A key idle for less than ttl is always kept, and one idle for more
+    than twice that is always gone, without any per-key bookkeeping."""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.evictions = 0
+        self._current = {}
+        self._previous = {}
+        self._rotated = time.monotonic()
+
+    def _rotate(self):
+        now = time.monotonic()
+        if now - self._rotated < self.ttl:
+            return
+
+        if now - self._rotated < 2 * self.ttl:
+            self.evictions += len(self._previous)
+            self._previous, self._current = self._current, {}
+        else:
+            self.evictions += len(self._previous) + len(self._current)
+            self._previous, self._current = {}, {}
+        self._rotated = now
+
+    def __len__(self):
+        self._rotate()
+        return len(self._current) + len(self._previous)
+
+    def __contains__(self, key):
+        return self.get(key, MISSING) is not MISSING
+
+    def __getitem__(self, key):
+        value = self.get(key, MISSING)
+        if value is MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self._rotate()
+        self._current[key] = value
+        self._previous.pop(key, None)
+
+    def get(self, key, default=None):
+        self._rotate()
+        try:
+            return self._current[key]
+        except KeyError:
+            pass
+
+        try:
+            value = self._previous.pop(key)
+        except KeyError:
+            return default
+
+        self._current[key] = value
+        return value
+
+    def items(self):
+        self._rotate()
+        return [*self._previous.items(), *self._current.items()]
+
+    def pop(self, key, default=None):
+        value = self._current.pop(key, MISSING)
+        if value is MISSING:
+            value = self._previous.pop(key, default)
+        return value
+
+    def clear(self):
+        self._current.clear()
+        self._previous.clear()
+
+    def stats(self):
+        self._rotate()
+        return {
+            "size": len(self._current) + len(self._previous),
+            "current": len(self._current),
+            "previous": len(self._previous),
+            "evictions": self.evictions,
+            "memory": sys.getsizeof(self._current) + sys.getsizeof(self._previous),
+        }
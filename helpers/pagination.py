@@ -76,6 +76,52 @@ class AsyncListPageSource(menus.AsyncIteratorPageSource):
         return embed
 
 
+class SeekPageSource(menus.PageSource):
+    """Page source that fetches each page with a range query starting at a cached page
+    boundary, instead of iterating a cursor past every earlier entry."""
+
+    def __init__(
+        self,
+        fetch_bounds,
+        fetch_page,
+        title=None,
+        show_index=False,
+        prepare_page=lambda self, items: None,
+        format_item=str,
+        per_page=20,
+    ):
+        self.fetch_bounds = fetch_bounds
+        self.fetch_page = fetch_page
+        self.title = title
+        self.show_index = show_index
+        self.prepare_page = prepare_page.__get__(self)
+        self.format_item = format_item.__get__(self)
+        self.per_page = per_page
+        self.count = None
+        self.bounds = []
+
+    async def prepare(self):
+        self.count, self.bounds = await self.fetch_bounds(self.per_page)
+
+    def is_paginating(self):
+        return len(self.bounds) > 1
+
+    def get_max_pages(self):
+        return len(self.bounds)
+
+    async def get_page(self, page_number):
+        if not 0 <= page_number < len(self.bounds):
+            raise IndexError("Page out of range.")
+
+        limit = min(self.per_page, self.count - page_number * self.per_page)
+        entries = await self.fetch_page(self.bounds[page_number], limit)
+        if len(entries) == 0:
+            raise IndexError("Page out of range.")
+        return entries
+
+    format_page = AsyncListPageSource.format_page
+
+
 class ContinuablePages(menus.MenuPages):
     def __init__(self, source, allow_last=True, allow_go=True, **kwargs):
         super().__init__(source, **kwargs)
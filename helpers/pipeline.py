@@ -0,0 +1,110 @@
+LOGICAL_OPERATORS = ("$and", "$or", "$nor")
+
+
+def is_in(value):
+    return isinstance(value, dict) and list(value.keys()) == ["$in"]
+
+
+def is_operators(value):
+    return isinstance(value, dict) and len(value) > 0 and all(x.startswith("$") for x in value)
+
+
+def merge_matches(a, b):
+    """Combines two $match queries into one that matches the documents matched by both.
+    Lists of $in values on the same field are intersected."""
+
+    result = {k: list(v) if k == "$and" else v for k, v in a.items()}
+
+    for key, value in b.items():
+        if key not in result:
+            result[key] = list(value) if key == "$and" else value
+        elif key == "$and":
+            result["$and"].extend(value)
+        elif is_in(result[key]) and is_in(value):
+            values = set(value["$in"])
+            result[key] = {"$in": [x for x in result[key]["$in"] if x in values]}
+        elif (
+            is_operators(result[key])
+            and is_operators(value)
+            and result[key].keys().isdisjoint(value.keys())
+        ):
+            result[key] = {**result[key], **value}
+        else:
+            result.setdefault("$and", []).append({key: value})
+
+    return result
+
+
+def optimize_pipeline(stages):
+    """Merges $match stages and moves them ahead of any $sort, never across $skip, $limit
+    or other stages, and drops $sort stages that are overridden by the following one."""
+
+    result = []
+
+    for stage in stages:
+        if "$match" in stage:
+            i = len(result)
+            while i > 0 and "$sort" in result[i - 1]:
+                i -= 1
+            if i > 0 and "$match" in result[i - 1]:
+                result[i - 1] = {"$match": merge_matches(result[i - 1]["$match"], stage["$match"])}
+            else:
+                result.insert(i, stage)
+        elif "$sort" in stage and len(result) > 0 and "$sort" in result[-1]:
+            result[-1] = stage
+        else:
+            result.append(stage)
+
+    return result
+
+
+def unwrap_path(path, prefix, keep):
+    if path.startswith(prefix):
+        return path[len(prefix) :]
+    if path in keep:
+        return path
+    return None
+
+
+def unwrap_query(query, prefix, keep):
+    result = {}
+
+    for key, value in query.items():
+        if key in LOGICAL_OPERATORS:
+            value = [unwrap_query(x, prefix, keep) for x in value]
+            if None in value:
+                return None
+            result[key] = value
+        else:
+            path = None if key.startswith("$") else unwrap_path(key, prefix, keep)
+            if path is None:
+                return None
+            result[path] = value
+
+    return result
+
+
+def unwrap_pipeline(stages, prefix, keep=()):
+    """Splits stages that run on documents nesting the original document under `prefix`
+    into the leading $match, $sort, $skip and $limit stages rewritten to refer to the
+    original document, and the remaining stages, which are returned unchanged."""
+
+    head = []
+
+    for stage in stages:
+        ((op, value),) = stage.items()
+
+        if op == "$match":
+            value = unwrap_query(value, prefix, keep)
+        elif op == "$sort":
+            paths = {unwrap_path(k, prefix, keep): v for k, v in value.items()}
+            value = None if None in paths else paths
+        elif op not in ("$skip", "$limit"):
+            value = None
+
+        if value is None:
+            break
+
+        head.append({op: value})
+
+    return head, stages[len(head) :]
@@ -0,0 +1,213 @@
+from array import array
+
+POKEDEX_SIZE = 810
+POKEDEX_WORDS = (POKEDEX_SIZE + 31) // 32
+
+
+# Denormalized counters on the member, each the sum of pokedex_counts over the species
+# in the named data list, or over every species for total_caught
+
+COUNTERS = {
+    "total_caught": None,
+    "mythicals_caught": "list_mythical",
+    "legendaries_caught": "list_legendary",
+    "ubs_caught": "list_ub",
+}
+
+
+# Pokécoins rewarded when a species is caught for the nth time
+
+CATCH_REWARDS = {
+    1: 35,
+    10: 350,
+    100: 3500,
+    1000: 35000,
+    10000: 350000,
+    100000: 3500000,
+}
+
+
+def replace_element(field, index, value, size):
+    return {
+        "$concatArrays": [
+            {"$slice": [f"${field}", index]},
+            [value],
+            {"$slice": [f"${field}", index + 1, size]},
+        ]
+    }
+
+
+def catch_update(species, shiny=False, reserve_idx=True):
+    """Returns an update pipeline that records a pokémon of the given species caught. It
+    updates the pokedex dict, the compact fields and the profile counters, and unless the
+    idx comes from elsewhere it reserves one. It also pays the catch reward and updates the
+    shiny streak, based on the member's values before the update."""
+
+    n = species.dex_number
+    word, bit = divmod(n, 32)
+    previous = {"$ifNull": [f"$pokedex.{n}", 0]}
+    caught = {"$arrayElemAt": ["$pokedex_caught", word]}
+
+    # The profile counters are only kept up to date once they have been computed, so that
+    # members who haven't been reconciled yet don't end up with partial counts
+
+    counters = ["total_caught"]
+    if species.mythical:
+        counters.append("mythicals_caught")
+    if species.legendary:
+        counters.append("legendaries_caught")
+    if species.ultra_beast:
+        counters.append("ubs_caught")
+
+    increments = {
+        x: {
+            "$cond": [
+                {"$eq": [{"$type": f"${x}"}, "missing"]},
+                "$$REMOVE",
+                {"$add": [f"${x}", 1]},
+            ]
+        }
+        for x in counters
+    }
+    if shiny:
+        increments["shinies_caught"] = {"$add": [{"$ifNull": ["$shinies_caught", 0]}, 1]}
+
+    if shiny:
+        streak = 0
+    else:
+        streak = {"$add": [{"$ifNull": ["$shiny_streak", 0]}, 1]}
+
+    if reserve_idx:
+        idx = {"next_idx": {"$add": [{"$ifNull": ["$next_idx", 1]}, 1]}}
+    else:
+        idx = {}
+
+    return [
+        {
+            "$set": {
+                f"pokedex.{n}": {"$add": [previous, 1]},
+                "pokedex_counts": replace_element(
+                    "pokedex_counts",
+                    n,
+                    {"$add": [{"$arrayElemAt": ["$pokedex_counts", n]}, 1]},
+                    POKEDEX_SIZE,
+                ),
+                "pokedex_caught": replace_element(
+                    "pokedex_caught",
+                    word,
+                    {
+                        "$cond": [
+                            {
+                                "$eq": [
+                                    {"$mod": [{"$floor": {"$divide": [caught, 1 << bit]}}, 2]},
+                                    0,
+                                ]
+                            },
+                            {"$add": [caught, 1 << bit]},
+                            caught,
+                        ]
+                    },
+                    POKEDEX_WORDS,
+                ),
+                **increments,
+                "balance": {
+                    "$add": [
+                        {"$ifNull": ["$balance", 0]},
+                        {
+                            "$switch": {
+                                "branches": [
+                                    {"case": {"$eq": [previous, k - 1]}, "then": v}
+                                    for k, v in CATCH_REWARDS.items()
+                                ],
+                                "default": 0,
+                            }
+                        },
+                    ]
+                },
+                **idx,
+                "shiny_streak": {
+                    "$cond": [
+                        {"$eq": ["$shiny_hunt", n]},
+                        streak,
+                        {"$ifNull": ["$shiny_streak", 0]},
+                    ]
+                },
+            }
+        }
+    ]
+
+
+def counters_pipeline(data):
+    """Returns an update pipeline that recomputes the profile counters from pokedex_counts."""
+
+    def total(species):
+        if species is None:
+            return {"$sum": "$pokedex_counts"}
+        return {
+            "$sum": {
+                "$map": {
+                    "input": [x for x in species if 0 <= x < POKEDEX_SIZE],
+                    "in": {"$arrayElemAt": ["$pokedex_counts", "$$this"]},
+                }
+            }
+        }
+
+    return [
+        {"$set": {k: total(None if v is None else getattr(data, v)) for k, v in COUNTERS.items()}}
+    ]
+
+
+class Pokedex:
+    """A member's pokédex. counts[i] is the number of pokémon caught with dex number i, and
+    bit i of the caught bitmap is set once at least one has been caught."""
+
+    __slots__ = ("counts", "caught")
+
+    def __init__(self, counts=None, caught=None):
+        self.counts = array("q", counts or [0] * POKEDEX_SIZE)
+        self.caught = array("Q", caught or [0] * POKEDEX_WORDS)
+
+    @classmethod
+    def from_dict(cls, pokedex):
+        self = cls()
+        for k, v in pokedex.items():
+            i = int(k)
+            if 0 <= i < POKEDEX_SIZE:
+                self.counts[i] = v
+                if v > 0:
+                    self.caught[i // 32] |= 1 << (i % 32)
+        return self
+
+    @classmethod
+    def from_mongo(cls, data):
+        """Builds the pokédex from a member document, or returns None if the compact fields
+        are missing or malformed and the pokedex dict has to be read instead."""
+
+        counts, caught = data.get("pokedex_counts"), data.get("pokedex_caught")
+        if not isinstance(counts, list) or not isinstance(caught, list):
+            return None
+        if len(counts) != POKEDEX_SIZE or len(caught) != POKEDEX_WORDS:
+            return None
+        return cls([x or 0 for x in counts], [x or 0 for x in caught])
+
+    def to_mongo(self):
+        return {"pokedex_counts": list(self.counts), "pokedex_caught": list(self.caught)}
+
+    def __getitem__(self, dex_number):
+        return self.counts[dex_number]
+
+    def is_caught(self, dex_number):
+        return self.caught[dex_number // 32] >> (dex_number % 32) & 1 == 1
+
+    def num_caught(self, species=None):
+        if species is None:
+            return sum(bin(x).count("1") for x in self.caught)
+        return sum(1 for i in species if 0 <= i < POKEDEX_SIZE and self.is_caught(i))
+
+    def total(self, species=None):
+        if species is None:
+            return sum(self.counts)
+        return sum(self.counts[i] for i in species if 0 <= i < POKEDEX_SIZE)
+
+    def items(self):
+        return ((i, x) for i, x in enumerate(self.counts) if i > 0)
@@ -1,3 +1,8 @@
+import contextlib
+import statistics
+import time
+from collections import defaultdict, deque
+
 import discord
 
 
@@ -25,3 +30,36 @@ class FakeUser(discord.Object):
 
     async def remove_roles(self, *args, **kwargs):
         pass
+
+
+class LatencyRecorder:
+    """Keeps the most recent durations of each named stage of an operation."""
+
+    def __init__(self, maxlen=1000):
+        self.samples = defaultdict(lambda: deque(maxlen=maxlen))
+
+    def record(self, stage, seconds):
+        self.samples[stage].append(seconds)
+
+    @contextlib.contextmanager
+    def measure(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def stats(self):
+        result = {}
+        for stage, samples in self.samples.items():
+            if len(samples) == 0:
+                continue
+            ordered = sorted(samples)
+            result[stage] = {
+                "count": len(ordered),
+                "mean_ms": statistics.mean(ordered) * 1000,
+                "p50_ms": ordered[len(ordered) // 2] * 1000,
+                "p95_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+                "max_ms": ordered[-1] * 1000,
+            }
+        return result
@@ -0,0 +1,123 @@
+import hashlib
+import time
+from collections import namedtuple
+
+import aioredis
+
+# The wild pokémon in a channel is kept in wild:{channel id} as "species:spawned:redeem",
+# where redeem is the time until which it can't be replaced by a regular spawn. The correct
+# guesses for it are kept in guesses:{channel id}, which is rewritten on every spawn so that
+# it follows the data. Users who caught it, in channels where it stays after being caught,
+# are kept in caught:{channel id}. All of them expire, so that channels that go quiet don't
+# keep their state forever.
+
+WILD_TTL = 7 * 24 * 60 * 60
+REDEEM_TTL = 30
+
+WRONG = 0
+CAUGHT = 1
+ALREADY_CAUGHT = 2
+
+# Claims the wild pokémon in a channel if the guess is in the set of correct guesses in
+# KEYS[3]. Returns nil if there is no wild pokémon, and otherwise {WRONG, CAUGHT or
+# ALREADY_CAUGHT, species id}. The wild pokémon is removed when caught unless ARGV[2] is
+# set, in which case the user in ARGV[3] is recorded and can't catch it again. If the set
+# of guesses is missing and ARGV[4] is the species of the wild pokémon, it's filled in
+# from the remaining arguments first.
+
+CLAIM_SCRIPT = """
+local value = redis.call("GET", KEYS[1])
+if not value then
+    return nil
+end
+local species = string.match(value, "^[^:]+")
+if ARGV[4] == species and redis.call("EXISTS", KEYS[3]) == 0 then
+    redis.call("SADD", KEYS[3], unpack(ARGV, 5))
+    local ttl = redis.call("TTL", KEYS[1])
+    if ttl > 0 then
+        redis.call("EXPIRE", KEYS[3], ttl)
+    end
+end
+if redis.call("SISMEMBER", KEYS[3], ARGV[1]) == 0 then
+    return {0, species}
+end
+if ARGV[2] == "0" then
+    redis.call("DEL", KEYS[1], KEYS[3])
+    return {1, species}
+end
+if redis.call("SADD", KEYS[2], ARGV[3]) == 0 then
+    return {2, species}
+end
+local ttl = redis.call("TTL", KEYS[1])
+if ttl > 0 then
+    redis.call("EXPIRE", KEYS[2], ttl)
+end
+return {1, species}
+"""
+
+CLAIM_SCRIPT_SHA = hashlib.sha1(CLAIM_SCRIPT.encode()).hexdigest()
+
+
+class Wild(namedtuple("Wild", ("species_id", "spawned", "redeem"))):
+    __slots__ = ()
+
+    @classmethod
+    def decode(cls, value):
+        species_id, spawned, redeem = value.decode().split(":")
+        return cls(int(species_id), float(spawned), float(redeem))
+
+    def encode(self):
+        return f"{self.species_id}:{self.spawned}:{self.redeem}"
+
+    @property
+    def redeemed(self):
+        return time.time() < self.redeem
+
+
+async def fetch(redis, channel_id):
+    value = await redis.get(f"wild:{channel_id}")
+    if value is None:
+        return None
+    return Wild.decode(value)
+
+
+async def spawn(redis, channel_id, species_id, guesses, redeem=False):
+    """Replaces the wild pokémon in a channel and its correct guesses in one transaction."""
+
+    now = time.time()
+    state = Wild(species_id, now, now + REDEEM_TTL if redeem else 0)
+
+    tr = redis.multi_exec()
+    tr.set(f"wild:{channel_id}", state.encode(), expire=WILD_TTL)
+    tr.delete(f"caught:{channel_id}", f"guesses:{channel_id}")
+    tr.sadd(f"guesses:{channel_id}", *guesses)
+    tr.expire(f"guesses:{channel_id}", WILD_TTL)
+    await tr.execute()
+
+    return state
+
+
+async def claim(redis, channel_id, guess, user_id, keep=False, species=None):
+    """Checks a guess against the wild pokémon in a channel and claims it in one round
+    trip. Returns None if there is no wild pokémon, and otherwise the outcome and the
+    species id. Only one of any number of concurrent correct guesses wins, and the others
+    find no wild pokémon. If a species is given, its correct guesses are used for a wild
+    pokémon of that species that was spawned without them."""
+
+    keys = [f"wild:{channel_id}", f"caught:{channel_id}", f"guesses:{channel_id}"]
+    args = [guess, int(keep), user_id]
+    if species is not None:
+        args += [species.id, *species.correct_guesses]
+
+    try:
+        result = await redis.evalsha(CLAIM_SCRIPT_SHA, keys=keys, args=args)
+    except aioredis.ReplyError as e:
+        if not str(e).startswith("NOSCRIPT"):
+            raise
+        result = await redis.eval(CLAIM_SCRIPT, keys=keys, args=args)
+
+    if result is None:
+        return None
+
+    outcome, species_id = result
+    return outcome, int(species_id)
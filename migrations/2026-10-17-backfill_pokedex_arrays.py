@@ -0,0 +1,72 @@
+"""
+This is a one-shot script used to backfill the compact pokedex_counts and pokedex_caught
+fields and the profile counters from the pokedex dict. Members whose pokedex changes while
+this runs are skipped and picked up by the next pass, so it can be run again safely.
+17 October 2026
+"""
+
+import os
+import sys
+
+import config
+from pymongo import MongoClient, UpdateOne
+
+sys.path.append(os.getcwd())
+
+from data import DataManager
+from helpers.pokedex import COUNTERS, POKEDEX_SIZE, POKEDEX_WORDS
+
+data = DataManager()
+
+client = MongoClient(config.DATABASE_URI)
+db = client[config.DATABASE_NAME]
+
+species_lists = {
+    k: None if v is None else [x for x in getattr(data, v) if 0 <= x < POKEDEX_SIZE]
+    for k, v in COUNTERS.items()
+}
+
+while True:
+    ops = []
+    total = 0
+
+    for member in db.member.find({"pokedex_counts": {"$not": {"$type": "array"}}}, {"pokedex": 1}):
+        pokedex = member.get("pokedex")
+        counts = [0] * POKEDEX_SIZE
+        caught = [0] * POKEDEX_WORDS
+
+        for k, v in (pokedex or {}).items():
+            i = int(k)
+            if not 0 <= i < POKEDEX_SIZE:
+                print(f"Skipping pokedex.{k} of member {member['_id']}, out of range")
+                continue
+            counts[i] = v
+            if v > 0:
+                caught[i // 32] |= 1 << (i % 32)
+
+        counters = {
+            k: sum(counts) if v is None else sum(counts[x] for x in v)
+            for k, v in species_lists.items()
+        }
+
+        ops.append(
+            UpdateOne(
+                {
+                    "_id": member["_id"],
+                    "pokedex": {"$exists": False} if pokedex is None else pokedex,
+                },
+                {"$set": {"pokedex_counts": counts, "pokedex_caught": caught, **counters}},
+            )
+        )
+
+        if len(ops) >= 1000:
+            total += db.member.bulk_write(ops, ordered=False).modified_count
+            ops = []
+
+    if len(ops) > 0:
+        total += db.member.bulk_write(ops, ordered=False).modified_count
+
+    print(f"Backfilled {total} members")
+
+    if total == 0:
+        break
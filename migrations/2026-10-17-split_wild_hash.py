@@ -0,0 +1,43 @@
+"""
+This is a one-shot script used to move wild pokémon from the wild hash to the per-channel
+wild:{channel id} keys, which expire. Channels that already have a key are left alone, so
+it can be run again safely. Redeem flags in redeem:{channel id} expire within 30 seconds
+and aren't carried over.
+17 October 2026
+"""
+
+import asyncio
+import time
+
+import aioredis
+import config
+
+WILD_TTL = 7 * 24 * 60 * 60
+
+
+async def main():
+    redis = await aioredis.create_redis_pool(**config.REDIS_CONF)
+
+    now = time.time()
+    wild = await redis.hgetall("wild")
+
+    pipe = redis.pipeline()
+    for channel_id, species_id in wild.items():
+        pipe.set(
+            f"wild:{channel_id.decode()}",
+            f"{species_id.decode()}:{now}:0",
+            expire=WILD_TTL,
+            exist=redis.SET_IF_NOT_EXIST,
+        )
+    results = await pipe.execute()
+
+    if len(wild) > 0:
+        await redis.hdel("wild", *wild.keys())
+
+    print(f"Moved {sum(1 for x in results if x)} of {len(wild)} wild pokémon")
+
+    redis.close()
+    await redis.wait_closed()
+
+
+asyncio.run(main())